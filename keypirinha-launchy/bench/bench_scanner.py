@@ -0,0 +1,195 @@
+"""
+Benchmark for the Launchy directory scanner.
+
+Generates synthetic directory trees and runs Launchy._scan_directory() over
+them outside of Keypirinha, using stand-ins for the keypirinha modules.
+For each config shape, it reports files and directories per second as well as
+the peak memory allocated during the scan.
+
+Usage:
+    python bench_scanner.py [--root DIR] [--fanout N] [--depth N] [--files N]
+                            [--exts EXT,...] [--repeat N] [--keep]
+
+Use --root to generate the trees somewhere specific (e.g. a tmpfs mount),
+otherwise a temporary directory is used and removed afterwards.
+"""
+
+import argparse
+import importlib
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+import types
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+
+# What the cases leave out of a [directories] entry
+ENTRY_DEFAULTS = dict(excludemode='substring', indexexes=False, ignorefile=None, maxitems=0, maxtime=0,
+                      followlinks=False, samedevice=False)
+
+# Directory names mixed into the tree so exclude-heavy configs have
+# something to prune
+EXCLUDED_NAMES = ['.git', 'node_modules', '__pycache__', 'build', 'dist']
+
+
+def stub_keypirinha():
+    """
+    Registers minimal keypirinha and keypirinha_util modules, enough to
+    import the plugin and run its scanner.
+    """
+    kp = types.ModuleType('keypirinha')
+
+    class Plugin:
+        def __init__(self):
+            pass
+
+        def should_terminate(self, wait=None):
+            return False
+
+        def info(self, *args):
+            pass
+
+        warn = error = dbg = info
+
+    class ItemCategory:
+        FILE = 2
+        USER_BASE = 1000
+
+    class ItemArgsHint:
+        ACCEPTED = 1
+
+    class ItemHitHint:
+        KEEPALL = 2
+
+    class Events:
+        PACKCONFIG = 1
+
+    kp.Plugin = Plugin
+    kp.ItemCategory = ItemCategory
+    kp.ItemArgsHint = ItemArgsHint
+    kp.ItemHitHint = ItemHitHint
+    kp.Events = Events
+    sys.modules['keypirinha'] = kp
+
+    kpu = types.ModuleType('keypirinha_util')
+    kpu.execute_default_action = lambda *args, **kwargs: None
+    sys.modules['keypirinha_util'] = kpu
+
+
+def load_plugin():
+    stub_keypirinha()
+
+    # The plugin is a package in Keypirinha, so that its lib folder can be
+    # imported relatively
+    package = types.ModuleType('launchy_package')
+    package.__path__ = [SRC_DIR]
+    sys.modules['launchy_package'] = package
+    return importlib.import_module('launchy_package.launchy')
+
+
+def generate_tree(root, fanout, depth, files, exts, seed=0):
+    """
+    Creates a tree where every directory holds `files` empty files with
+    extensions drawn from `exts`, and `fanout` subdirectories down to `depth`.
+    Returns the number of directories and files created.
+    """
+    rng = random.Random(seed)
+    num_dirs = num_files = 0
+    pending = [(root, 0)]
+    while pending:
+        path, level = pending.pop()
+        os.makedirs(path, exist_ok=True)
+        num_dirs += 1
+
+        for i in range(files):
+            name = 'file{}.{}'.format(i, rng.choice(exts))
+            open(os.path.join(path, name), 'w').close()
+            num_files += 1
+
+        if level < depth:
+            for i in range(fanout):
+                if rng.random() < 0.2:
+                    name = rng.choice(EXCLUDED_NAMES)
+                    if os.path.exists(os.path.join(path, name)):
+                        name = 'dir{}'.format(i)
+                else:
+                    name = 'dir{}'.format(i)
+                pending.append((os.path.join(path, name), level + 1))
+
+    return num_dirs, num_files
+
+
+def run_case(module, plugin, root, config, repeat, snapshot=None):
+    best = None
+    for _ in range(repeat):
+        new_snapshot = {}
+        stats = module.ScanStats(0, root)
+        tracemalloc.start()
+        start = time.perf_counter()
+        options = module.ScanOptions(dict(ENTRY_DEFAULTS, **config), root)
+        count = sum(1 for _ in plugin._scan_directory(root, options, snapshot, new_snapshot, stats=stats))
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        result = (elapsed, count, stats.dirs_visited, stats.files_examined, peak)
+        if best is None or elapsed < best[0]:
+            best = result
+
+    return best, new_snapshot
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--root', help="where to generate the trees (default: temporary directory)")
+    parser.add_argument('--fanout', type=int, default=6, help="subdirectories per directory")
+    parser.add_argument('--depth', type=int, default=4, help="depth of the generated tree")
+    parser.add_argument('--files', type=int, default=20, help="files per directory")
+    parser.add_argument('--exts', default='exe,lnk,txt,dll,py,ini', help="comma separated file extensions")
+    parser.add_argument('--repeat', type=int, default=3, help="runs per case, the fastest is reported")
+    parser.add_argument('--keep', action='store_true', help="keep the generated tree")
+    args = parser.parse_args()
+
+    module = load_plugin()
+    plugin = module.Launchy()
+    base = tempfile.mkdtemp(prefix='launchy-bench-', dir=args.root)
+    root = os.path.join(base, 'tree')
+    try:
+        num_dirs, num_files = generate_tree(root, args.fanout, args.depth, args.files, args.exts.split(','))
+        print("Tree: {} directories, {} files (fanout={}, depth={}, files={})".format(
+            num_dirs, num_files, args.fanout, args.depth, args.files))
+
+        excludes = ','.join(EXCLUDED_NAMES)
+        cases = [
+            ('all files', dict(types='*.*', excludedirs='', indexdirs=False, depth=-1)),
+            ('two types', dict(types='*.exe,*.lnk', excludedirs='', indexdirs=False, depth=-1)),
+            ('depth 1', dict(types='*.*', excludedirs='', indexdirs=False, depth=1)),
+            ('depth 2', dict(types='*.exe,*.lnk', excludedirs='', indexdirs=False, depth=2)),
+            ('exclude-heavy', dict(types='*.*', excludedirs=excludes, indexdirs=False, depth=-1)),
+            ('indexdirs only', dict(types='', excludedirs='', indexdirs=True, depth=-1)),
+            ('indexdirs+types', dict(types='*.exe', excludedirs=excludes, indexdirs=True, depth=-1)),
+        ]
+
+        header = "{:<18} {:>9} {:>8} {:>8} {:>12} {:>11} {:>10}"
+        row = "{:<18} {:>9.3f} {:>8} {:>8} {:>12,.0f} {:>11,.0f} {:>10.1f}"
+        print(header.format('case', 'seconds', 'items', 'dirs', 'files/sec', 'dirs/sec', 'peak KiB'))
+        for name, config in cases:
+            (elapsed, count, dirs, examined, peak), snapshot = run_case(module, plugin, root, config, args.repeat)
+            print(row.format(name, elapsed, count, dirs, examined / elapsed, dirs / elapsed, peak / 1024))
+
+            # Same scan again, reusing the directory snapshot of the first one
+            (elapsed, count, dirs, examined, peak), _ = run_case(module, plugin, root, config, args.repeat, snapshot)
+            print(row.format('  (snapshot)', elapsed, count, dirs, examined / elapsed, dirs / elapsed, peak / 1024))
+    finally:
+        if args.keep:
+            print("Tree kept in {}".format(root))
+        else:
+            shutil.rmtree(base, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
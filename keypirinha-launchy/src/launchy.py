@@ -1,9 +1,456 @@
 # Keypirinha launcher (keypirinha.com)
+from .lib import watcher
 
 import keypirinha_util as kpu
 import keypirinha as kp
+from concurrent.futures import ThreadPoolExecutor
+import collections
+import itertools
+import array
+import fnmatch
+import hashlib
+import queue
+import gzip
+import threading
 import time
+import json
+import stat
+import sys
 import os
+import re
+
+# Bump whenever the content of cached directory listings changes meaning
+SNAPSHOT_VERSION = 2
+
+# Bump whenever the format of the catalog index changes
+INDEX_VERSION = 2
+
+# Bump whenever the format of suspended scan continuations changes
+CONTINUATION_VERSION = 1
+
+# Maximum number of batches a scanning thread can get ahead of the catalog
+SCAN_QUEUE_SIZE = 4
+
+
+def config_hash(config):
+    return hashlib.sha1(json.dumps(config, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def config_keys(configs):
+    """
+    Keys of the configs in the index and continuations: their hash, numbered
+    when several entries are identical so that each one keeps its own paths.
+    """
+    keys = []
+    counts = collections.Counter()
+    for config in configs:
+        key = config_hash(config)
+        counts[key] += 1
+        keys.append(key if counts[key] == 1 else '{}-{}'.format(key, counts[key]))
+    return keys
+
+
+def join_path(dir_path, name):
+    """
+    Builds the full path of a (directory, name) pair of the scanner, where
+    an empty name stands for the directory itself.
+    """
+    return os.path.join(dir_path, name) if name else dir_path
+
+
+def normalize_dir(path):
+    """
+    Normalizes a directory path for comparisons, with a trailing separator
+    so that prefix checks only match whole path components.
+    """
+    return os.path.join(os.path.normcase(os.path.normpath(path)), '')
+
+
+def find_overlaps(roots):
+    """
+    Given the root path of each [directories] entry (keyed by index), finds
+    the entries whose trees overlap with another one. Returns, for each of
+    them, the normalized prefixes of the directories they share.
+    """
+    roots = {i: normalize_dir(root) for i, root in roots.items()}
+    overlaps = {}
+    for i, root in roots.items():
+        prefixes = set()
+        for j, other in roots.items():
+            if i != j and (root.startswith(other) or other.startswith(root)):
+                # The shared part is the tree of the deepest of the two roots
+                prefixes.add(max(root, other, key=len))
+        if prefixes:
+            overlaps[i] = tuple(prefixes)
+    return overlaps
+
+
+def directory_filter(dir_paths):
+    """
+    Returns a function telling whether a directory is one of dir_paths or
+    is under one of them.
+    """
+    dir_paths = set(dir_paths)
+    prefixes = tuple(os.path.join(dir_path, '') for dir_path in dir_paths)
+    return lambda path: path in dir_paths or path.startswith(prefixes)
+
+
+def format_index_lines(pairs, last_dir=None):
+    """
+    Formats (directory, name) pairs as index lines. Each run of pairs in the
+    same directory is written as a "|directory" line followed by one line
+    per name. Returns the lines and the last directory written.
+    """
+    lines = []
+    for dir_path, name in pairs:
+        if dir_path != last_dir:
+            lines.append('|' + dir_path + '\n')
+            last_dir = dir_path
+        lines.append(name + '\n')
+    return lines, last_dir
+
+
+class IndexWriter:
+    """
+    Writes the index text to fp (if given) while hashing it. As the index
+    lists every cataloged path in order, the hash identifies the content of
+    the catalog and tells whether a new scan changed anything.
+    """
+    def __init__(self, fp=None):
+        self.fp = fp
+        self.sha1 = hashlib.sha1()
+
+    def write(self, text):
+        self.sha1.update(text.encode('utf-8'))
+        if self.fp is not None:
+            self.fp.write(text)
+
+    def writelines(self, lines):
+        self.write(''.join(lines))
+
+    def hexdigest(self):
+        return self.sha1.hexdigest()
+
+
+class PathTable:
+    """
+    Compact list of (directory, name) pairs, used to hold large numbers of
+    cataloged paths. Each directory is stored once and referenced by index,
+    and names are interned since many are repeated across directories.
+    Full paths are only built when needed, using join_path().
+    """
+    def __init__(self, pairs=()):
+        self.dirs = []
+        self.dir_indexes = {}
+        self.parents = array.array('I')
+        self.names = []
+        for dir_path, name in pairs:
+            self.add(dir_path, name)
+
+    def add(self, dir_path, name=''):
+        index = self.dir_indexes.get(dir_path)
+        if index is None:
+            index = self.dir_indexes[dir_path] = len(self.dirs)
+            self.dirs.append(dir_path)
+        self.parents.append(index)
+        self.names.append(sys.intern(name))
+
+    def __len__(self):
+        return len(self.names)
+
+    def __iter__(self):
+        dirs = self.dirs
+        for parent, name in zip(self.parents, self.names):
+            yield dirs[parent], name
+
+
+def compile_name_patterns(patterns):
+    """
+    Compiles a list of glob patterns (e.g. "*.lnk", "setup*.exe") into a
+    single case-insensitive matcher, or None if there is nothing to match.
+    As in Launchy, "*.*" matches every file, even without an extension, and
+    plain extensions ("exe", ".lnk") match the files ending with them.
+    """
+    patterns = [p.strip() for p in patterns]
+    patterns = ['*' if p == '*.*' else p for p in patterns if p and p != '@Invalid()']
+    patterns = [p if any(c in p for c in '*?[') else '*.' + p.lstrip('.') for p in patterns]
+    if not patterns:
+        return None
+
+    regex = '|'.join(fnmatch.translate(p) for p in patterns)
+    return re.compile(regex, re.IGNORECASE).match
+
+
+class ExcludeMatcher:
+    """
+    Matches directories against all the excludedirs patterns in one pass.
+
+    In "substring" mode (Launchy's behavior), a directory is excluded if any
+    pattern appears anywhere in its path. In "component" mode, it is only
+    excluded if one of its path components is equal to a pattern, ignoring
+    case, so that "bin" no longer excludes "C:\\cabinet".
+
+    Directories are checked as they are discovered, before being entered. As
+    their parent was already accepted, only the new part of the path needs
+    to be looked at.
+    """
+    MODES = ('substring', 'component')
+
+    def __init__(self, patterns, mode='substring'):
+        patterns = [p.strip() for p in patterns]
+        patterns = [p for p in patterns if p]
+        self.mode = mode
+        self.names = None
+        self.regex = None
+        if not patterns:
+            return
+
+        if mode == 'component':
+            self.names = frozenset(p.strip(os.path.sep).lower() for p in patterns)
+        else:
+            # Longest pattern first, so the overlap with the parent path is
+            # big enough for any pattern to straddle the separator
+            patterns.sort(key=len, reverse=True)
+            self.overlap = len(patterns[0]) - 1
+            self.regex = re.compile('|'.join(re.escape(p) for p in patterns))
+
+    def __bool__(self):
+        return self.names is not None or self.regex is not None
+
+    def match_path(self, path):
+        if self.names is not None:
+            return any(part.lower() in self.names for part in path.split(os.path.sep))
+        if self.regex is not None:
+            return self.regex.search(path) is not None
+        return False
+
+    def match_child(self, parent_path, name):
+        if self.names is not None:
+            return name.lower() in self.names
+        if self.regex is not None:
+            tail = parent_path[max(0, len(parent_path) - self.overlap):]
+            return self.regex.search(tail + os.path.sep + name) is not None
+        return False
+
+
+class IgnoreRules:
+    """
+    Ignore rules of a root directory, read from a file using the gitignore
+    syntax: "#" comments, "!" negations, a trailing "/" to only match
+    directories, patterns containing a "/" anchored to the root and "**" to
+    match any number of directories. As in git, the last matching rule wins
+    and matching ignores case.
+
+    Directories are checked before being entered, so nothing under an
+    ignored directory is ever listed.
+    """
+    def __init__(self, root_path, lines):
+        self.root_path = root_path.rstrip(os.path.sep)
+        self.rules = []
+        for line in lines:
+            line = line.rstrip('\r\n')
+            if not line.endswith('\\ '):
+                line = line.rstrip(' ')
+            if not line or line.startswith('#'):
+                continue
+
+            negate = line.startswith('!')
+            if negate:
+                line = line[1:]
+            dir_only = line.endswith('/')
+            line = line.rstrip('/')
+            if not line:
+                continue
+
+            anchored = '/' in line
+            regex = self.translate(line.lstrip('/'))
+            if not anchored:
+                regex = '(?:.*/)?' + regex
+            self.rules.append((re.compile(regex + r'\Z', re.IGNORECASE), negate, dir_only))
+
+        # Without negations, any matching rule ignores the path
+        self.combined = None
+        if not any(negate for _, negate, _ in self.rules):
+            self.combined = (
+                self._combine(regex for regex, _, dir_only in self.rules if not dir_only),
+                self._combine(regex for regex, _, _ in self.rules))
+
+    @classmethod
+    def load(cls, root_path, file_name):
+        """
+        Reads the rules from file_name in root_path, returns None if there
+        is no such file or no rule in it.
+        """
+        try:
+            with open(os.path.join(root_path, file_name), encoding='utf-8', errors='replace') as f:
+                rules = cls(root_path, f)
+        except OSError:
+            return None
+        return rules if rules.rules else None
+
+    @staticmethod
+    def translate(pattern):
+        """Converts a gitignore pattern (without its leading "/") to a regex."""
+        regex = ''
+        i, n = 0, len(pattern)
+        while i < n:
+            c = pattern[i]
+            if pattern.startswith('**/', i) and (i == 0 or pattern[i - 1] == '/'):
+                regex += '(?:.*/)?'
+                i += 3
+                continue
+            if pattern.startswith('**', i) and i + 2 == n and (i == 0 or pattern[i - 1] == '/'):
+                regex += '.*'
+                i += 2
+                continue
+
+            if c == '*':
+                regex += '[^/]*'
+            elif c == '?':
+                regex += '[^/]'
+            elif c == '\\' and i + 1 < n:
+                i += 1
+                regex += re.escape(pattern[i])
+            elif c == '[' and ']' in pattern[i + 2:]:
+                end = pattern.index(']', i + 2)
+                chars = pattern[i + 1:end]
+                if chars[0] == '!':
+                    chars = '^' + chars[1:]
+                regex += '[' + chars.replace('\\', '\\\\') + ']'
+                i = end
+            else:
+                regex += re.escape(c)
+            i += 1
+
+        return regex
+
+    @staticmethod
+    def _combine(regexes):
+        patterns = [regex.pattern for regex in regexes]
+        if not patterns:
+            return None
+        return re.compile('|'.join('(?:{})'.format(p) for p in patterns), re.IGNORECASE)
+
+    def match(self, dir_path, name, is_dir):
+        """Tells whether the file or directory name in dir_path is ignored."""
+        relative_dir = dir_path[len(self.root_path) + 1:]
+        if os.path.sep != '/':
+            relative_dir = relative_dir.replace(os.path.sep, '/')
+        path = relative_dir + '/' + name if relative_dir else name
+
+        if self.combined is not None:
+            regex = self.combined[is_dir]
+            return regex is not None and regex.match(path) is not None
+
+        for regex, negate, dir_only in reversed(self.rules):
+            if (is_dir or not dir_only) and regex.match(path):
+                return not negate
+        return False
+
+
+class ExecutableMatcher:
+    """
+    Tells whether the files listed by os.scandir() are executables, for the
+    indexexes option.
+
+    On Windows, the executable mode bits reported by stat() only depend on the
+    file extension, so the decision is made once per extension and no file
+    has to be looked at. Elsewhere, files with other extensions are checked
+    for their mode bits.
+    """
+    EXTENSIONS = ('.exe', '.bat', '.cmd', '.com')
+
+    def __init__(self):
+        self.by_extension = {}
+
+    def __call__(self, entry):
+        extension = os.path.splitext(entry.name)[1]
+        try:
+            executable = self.by_extension[extension]
+        except KeyError:
+            executable = extension.lower() in self.EXTENSIONS or (False if os.name == 'nt' else None)
+            self.by_extension[extension] = executable
+
+        if executable is not None:
+            return executable
+        try:
+            return entry.is_file() and bool(entry.stat().st_mode & 0o111)
+        except OSError:
+            return False
+
+
+
+class ScanStats:
+    """
+    Counters and timing of the scan of a single [directories] entry.
+    Directories reused from the snapshot are counted as cached, and their
+    files are not examined again. Directories whose listing was shared by
+    another entry during the same pass are counted as shared. Entries
+    reloaded from the index instead of being scanned are flagged as reused,
+    and those picking up a scan stopped by maxtime as resumed.
+    """
+    FIELDS = ('dirs_visited', 'dirs_cached', 'dirs_shared', 'dirs_pruned_depth', 'dirs_pruned_exclude',
+              'dirs_pruned_visited', 'dirs_pruned_device', 'dirs_pruned_ignore', 'dirs_pending', 'files_examined',
+              'files_matched', 'files_ignored', 'items', 'duplicates', 'errors', 'elapsed')
+
+    def __init__(self, index, name):
+        self.index = index
+        self.name = name
+        self.reused = False
+        self.resumed = False
+        self.truncated = False
+        for field in self.FIELDS:
+            setattr(self, field, 0)
+
+    def as_dict(self):
+        stats = {'config': self.index + 1, 'name': self.name, 'reused': self.reused, 'resumed': self.resumed,
+                 'truncated': self.truncated}
+        stats.update((field, getattr(self, field)) for field in self.FIELDS)
+        return stats
+
+    def __str__(self):
+        if self.reused:
+            return "Config #{config} ({name}): {items} items reused from the last scan".format(
+                **self.as_dict())
+        notes = []
+        if self.resumed:
+            notes.append("resumed")
+        if self.truncated:
+            notes.append("maxitems reached")
+        if self.dirs_pending:
+            notes.append("maxtime reached, {} directories left".format(self.dirs_pending))
+        return ("Config #{config} ({name}): {items} items in {elapsed:0.1f} seconds{notes}, "
+                "{dirs_visited} directories visited ({dirs_cached} cached, {dirs_shared} shared), "
+                "{dirs_pruned_depth} pruned by depth, {dirs_pruned_exclude} pruned by exclude, "
+                "{dirs_pruned_visited} already visited, {dirs_pruned_device} on other devices, "
+                "{dirs_pruned_ignore} pruned by ignore file, {files_examined} files examined, {files_matched} matched, "
+                "{files_ignored} ignored, {duplicates} duplicates, "
+                "{errors} errors").format(
+                    **dict(self.as_dict(), notes=" ({})".format(", ".join(notes)) if notes else ""))
+
+
+class ScanOptions:
+    """
+    What the scans of a [directories] entry match and how they walk its
+    tree, with the matchers compiled once for all of them.
+
+    Links to directories are followed if follow_links is set, and
+    directories on another device than the root are skipped if same_device
+    is set. If the ignore file of the entry exists in its root, the files
+    and directories matching its rules are skipped (see IgnoreRules).
+    """
+    def __init__(self, config, root_path):
+        self.root_path = root_path.rstrip(os.path.sep)
+        self.match_name = compile_name_patterns(config['types'].split(','))
+        self.match_exe = ExecutableMatcher() if config['indexexes'] else None
+        self.exclude = ExcludeMatcher(config['excludedirs'].split(','), config['excludemode'])
+        self.ignore = IgnoreRules.load(self.root_path, config['ignorefile']) if config['ignorefile'] else None
+        self.inc_dirs = config['indexdirs']
+        self.max_level = config['depth'] or -1
+        self.max_items = config['maxitems']
+        self.max_time = config['maxtime']
+        self.follow_links = config['followlinks']
+        self.same_device = config['samedevice']
 
 
 class Launchy(kp.Plugin):
@@ -18,10 +465,25 @@ class Launchy(kp.Plugin):
     """
     def __init__(self):
         super().__init__()
+        self.catalog_lock = threading.Lock()
+        self.catalog_hash = None
+        self.catalog_paths = None
+        self.watcher = None
+        self.watcher_settings = None
+        self.suggest_cache = collections.OrderedDict()
 
     def _update_config(self):
         self.dir_configs = []
         settings = self.load_settings()
+        self.scan_threads = settings.get_int('scan_threads', 'main', fallback=1, min=1)
+        self.batch_size = settings.get_int('batch_size', 'main', fallback=1000, min=1)
+        self.dump_stats = settings.get_bool('dump_stats', 'main', fallback=False)
+        self.suggest_cache_size = settings.get_int('suggest_cache_size', 'main', fallback=16, min=0)
+        self.watch = settings.get_bool('watch', 'main', fallback=False)
+        self.watch_backend = settings.get_enum('watch_backend', 'main', fallback='auto', enum=watcher.BACKENDS)
+        self.watch_delay = settings.get_float('watch_delay', 'main', fallback=2.0, min=0.1)
+        self.watch_interval = settings.get_float('watch_interval', 'main', fallback=30.0, min=1.0)
+
         size = settings.get_int('size', 'directories')
         if size is None:
             self.warn('No size parameter specified')
@@ -35,6 +497,14 @@ class Launchy(kp.Plugin):
                 'depth': settings.get_int(k + '\\depth', 'directories', fallback=0),
                 'indexdirs': settings.get_bool(k + '\\indexdirs', 'directories', fallback=False),
                 'excludedirs': settings.get_stripped(k + '\\excludedirs', 'directories', fallback=''),
+                'excludemode': settings.get_enum(k + '\\excludemode', 'directories', fallback='substring',
+                                                 enum=ExcludeMatcher.MODES),
+                'indexexes': settings.get_bool(k + '\\indexexes', 'directories', fallback=False),
+                'maxitems': settings.get_int(k + '\\maxitems', 'directories', fallback=0, min=0),
+                'maxtime': settings.get_float(k + '\\maxtime', 'directories', fallback=0.0, min=0.0),
+                'ignorefile': settings.get_stripped(k + '\\ignorefile', 'directories', fallback='.kpignore'),
+                'followlinks': settings.get_bool(k + '\\followlinks', 'directories', fallback=False),
+                'samedevice': settings.get_bool(k + '\\samedevice', 'directories', fallback=False),
             })
 
         self.settings = settings
@@ -42,119 +512,884 @@ class Launchy(kp.Plugin):
         loaded_msg = "Successfully updated the configuration, found {} entries"
         self.info(loaded_msg.format(len(self.dir_configs)))
 
-    def _scan_directory(self, root_path, name_patterns=None,  exclude=None, inc_dirs=None, max_level=None):
+    def _read_directory(self, dir_path, stats):
         """
-        This function replaces the scan_directory() function from the api adding
-        the ability to filter by file name as well.
+        Reads the (entry, is_dir, is_link) entries of a directory, where
+        entry is the os.DirEntry, holding on to what os.scandir() found.
         """
+        entries = []
+        for entry in os.scandir(dir_path):
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                stats.errors += 1
+                is_dir = False
+
+            entries.append((entry, is_dir, is_dir and entry.is_symlink()))
+
+        return entries
+
+    def _list_directory(self, dir_path, match_name, descend, stats, listings=None, follow_links=False,
+                        match_exe=None):
+        """
+        Lists a single directory, returning the names of the files accepted
+        by match_name or match_exe and of the subdirectories to walk into
+        (if descend).
+        Links to directories are only walked into if follow_links is set.
+
+        If given, listings holds the entries of the directories already read
+        during this pass by other configs, and is filled for the next ones.
+        """
+        entries = None
+        if listings is not None:
+            key = normalize_dir(dir_path)
+            entries = listings.get(key)
+            if entries is not None:
+                stats.dirs_shared += 1
+
+        if entries is None:
+            entries = self._read_directory(dir_path, stats)
+            if listings is not None:
+                listings[key] = entries
+
+        files = []
+        subdirs = []
+        for entry, is_dir, is_link in entries:
+            if is_dir:
+                if is_link and not follow_links:
+                    continue
+                if descend:
+                    subdirs.append(entry.name)
+                else:
+                    stats.dirs_pruned_depth += 1
+            else:
+                stats.files_examined += 1
+                if (match_name and match_name(entry.name)) or (match_exe and match_exe(entry)):
+                    files.append(entry.name)
+
+        return files, subdirs
+
+    def _scan_directory(self, root_path, options, snapshot=None, new_snapshot=None, stats=None, start_level=0,
+                        listings=None, shared_prefixes=(), frontier=None, continuation=None):
+        """
+        This function replaces the scan_directory() function from the api adding
+        the ability to filter by file name as well. Matching paths are yielded
+        as they are found, as (directory, name) pairs where an empty name
+        stands for the directory itself (see join_path()). What is matched and
+        how the tree is walked is set by options (see ScanOptions).
+
+        If given, snapshot maps directory paths to their [mtime, files, subdirs]
+        from a previous scan, and directories whose mtime did not change are not
+        listed again. Every directory visited is recorded in new_snapshot.
+
+        The work done is counted in stats, if given. When scanning a subtree
+        of a config, start_level is the depth of root_path in that config.
+
+        With options.max_items, the tree is walked breadth first so that the
+        shallowest paths are kept, and the scan stops after max_items paths.
 
-        name_patterns = name_patterns or []
-        exclude = exclude or []
-        inc_dirs = inc_dirs or 0
-        max_level = max_level or -1
+        Directories under shared_prefixes are also scanned by other configs,
+        their listings are shared with them through listings.
 
-        paths=[]
+        Directories are identified by device and inode, so that none is
+        visited twice and link cycles end.
 
-        # Generates a tuple of allowed file types
-        if '' in name_patterns: name_patterns.remove('')
-        if '@Invalid()' in name_patterns: name_patterns.remove('@Invalid()')
-        name_patterns = [i.strip('.*') for i in name_patterns]
-        name_patterns = tuple(name_patterns)
+        With options.max_time, the scan stops after max_time seconds and the
+        (directory, level) pairs still to walk are added to continuation. They can be given back as frontier to
+        resume the scan from there.
+        """
 
-        # Generates list of forbided strings from direcory paths
-        if '' in exclude: exclude.remove('')
+        snapshot = snapshot or {}
+        new_snapshot = new_snapshot if new_snapshot is not None else {}
+        stats = stats or ScanStats(0, root_path)
+        match_name, match_exe = options.match_name, options.match_exe
+        exclude, ignore = options.exclude, options.ignore
+        max_level, max_items, max_time = options.max_level, options.max_items, options.max_time
 
-        # Gets the max depth from a system level
         root_path = root_path.rstrip(os.path.sep)
         assert os.path.isdir(root_path)
-        num_sep = root_path.count(os.path.sep) + 1
+        if exclude.match_path(root_path):
+            stats.dirs_pruned_exclude += 1
+            return
 
-        # Walks down directory tree adding to paths[]
-        for walk_root, walk_dirs, walk_files in os.walk(root_path):
+        # Windows junctions are not seen as links and were always walked
+        # into, so visited directories are tracked even without follow_links
+        root_device = os.stat(root_path).st_dev
+        visited = set()
+
+        # Walks down directory tree yielding paths. Subdirectories past
+        # max_level or matching an exclude are never entered, which matters
+        # a lot for shallow scans of large roots (e.g. a drive root).
+        pending = collections.deque(frontier or [(root_path, start_level)])
+        breadth_first = max_items > 0
+        deadline = time.time() + max_time if max_time else None
+        while pending:
             if self.should_terminate():
-                return paths
+                return
+
+            if max_items and stats.items >= max_items:
+                self._truncate_scan(root_path, max_items, stats)
+                return
+
+            walk_root, level = pending.popleft() if breadth_first else pending.pop()
+            try:
+                dir_stat = os.stat(walk_root)
+                if options.same_device and dir_stat.st_dev != root_device:
+                    stats.dirs_pruned_device += 1
+                    continue
+                # Some file systems do not provide inodes (st_ino is 0)
+                if dir_stat.st_ino:
+                    dir_id = (dir_stat.st_dev, dir_stat.st_ino)
+                    if dir_id in visited:
+                        stats.dirs_pruned_visited += 1
+                        continue
+                    visited.add(dir_id)
+
+                mtime = dir_stat.st_mtime_ns
+                cached = snapshot.get(walk_root)
+                if cached and cached[0] == mtime:
+                    files, subdirs = cached[1], cached[2]
+                    stats.dirs_cached += 1
+                else:
+                    descend = max_level == -1 or level < max_level
+                    shared = shared_prefixes and normalize_dir(walk_root).startswith(shared_prefixes)
+                    files, subdirs = self._list_directory(walk_root, match_name, descend, stats,
+                                                          listings if shared else None, options.follow_links,
+                                                          match_exe)
+            except OSError:
+                stats.errors += 1
+                continue
+
+            new_snapshot[walk_root] = [mtime, files, subdirs]
+            stats.dirs_visited += 1
+
+            # Ignore rules are applied after the snapshot, so that editing
+            # the ignore file does not require listing directories again
+            if ignore:
+                kept_files = [name for name in files if not ignore.match(walk_root, name, False)]
+                stats.files_ignored += len(files) - len(kept_files)
+                files = kept_files
 
-            # Checks the level is valid
-            num_sep_this = walk_root.count(os.path.sep)
-            if (num_sep + max_level > num_sep_this) or (max_level == -1):
+            # If indexing directories add the current directory to the index.
+            names = itertools.chain([''], files) if options.inc_dirs else files
+            stats.files_matched += len(files)
+            for name in names:
+                if max_items and stats.items >= max_items:
+                    # Also the last chance to notice it, when this was the
+                    # last directory pending (e.g. at the maximum depth)
+                    self._truncate_scan(root_path, max_items, stats)
+                    return
+                stats.items += 1
+                yield walk_root, name
 
-                if not any(ext in walk_root for ext in exclude):
+            # Without a budget, same order as os.walk(): depth first, in
+            # listing order. With one, breadth first in listing order.
+            subdirs = subdirs if breadth_first else reversed(subdirs)
+            for name in subdirs:
+                if exclude and exclude.match_child(walk_root, name):
+                    stats.dirs_pruned_exclude += 1
+                    continue
+                if ignore and ignore.match(walk_root, name, True):
+                    stats.dirs_pruned_ignore += 1
+                    continue
+                pending.append((os.path.join(walk_root, name), level + 1))
 
-                    # If indexing directories add the current directory to the index.
-                    if inc_dirs:
-                        paths.append(walk_root)
+            if deadline and pending and time.time() >= deadline:
+                self.info("Suspended scanning '{}' after {} seconds, {} directories left for the next pass".format(
+                    root_path, max_time, len(pending)))
+                stats.dirs_pending = len(pending)
+                if continuation is not None:
+                    continuation.extend(pending)
+                return
 
-                    if name_patterns:
-                        for name in walk_files:
-                            if name.endswith(name_patterns):
-                                paths.append(os.path.join(walk_root, name))
+    def _truncate_scan(self, root_path, max_items, stats):
+        self.warn("Stopped scanning '{}' after reaching the limit of {} items".format(root_path, max_items))
+        stats.truncated = True
 
-        return paths
+    def _load_snapshots(self):
+        self.snapshots = {}
+        cache_path = self.get_package_cache_path(create=True)
+        snapshot_path = os.path.join(cache_path, 'snapshot.json')
+        if os.path.exists(snapshot_path):
+            try:
+                with open(snapshot_path) as fp:
+                    data = json.load(fp)
+                if data.get('version') == SNAPSHOT_VERSION:
+                    self.snapshots = data['configs']
+            except (ValueError, KeyError, AttributeError) as e:
+                self.warn('Failed to load directory snapshot: {}'.format(e))
 
+    def _save_snapshots(self):
+        cache_path = self.get_package_cache_path(create=True)
+        snapshot_path = os.path.join(cache_path, 'snapshot.json')
+        with open(snapshot_path, 'w') as fp:
+            json.dump({'version': SNAPSHOT_VERSION, 'configs': self.snapshots}, fp)
+
+    def _load_continuations(self):
+        """
+        Reads the directories left to scan by the scans suspended by maxtime,
+        as lists of (directory, level) pairs keyed as by config_keys().
+        """
+        cache_path = self.get_package_cache_path(create=True)
+        continuation_path = os.path.join(cache_path, 'continuation.json')
+        if os.path.exists(continuation_path):
+            try:
+                with open(continuation_path) as fp:
+                    data = json.load(fp)
+                if data.get('version') == CONTINUATION_VERSION:
+                    return data['configs']
+            except (ValueError, KeyError, AttributeError) as e:
+                self.warn('Failed to load scan continuation: {}'.format(e))
+        return {}
+
+    def _save_continuations(self, continuations):
+        cache_path = self.get_package_cache_path(create=True)
+        continuation_path = os.path.join(cache_path, 'continuation.json')
+        if not continuations:
+            if os.path.exists(continuation_path):
+                os.remove(continuation_path)
+            return
+        with open(continuation_path, 'w') as fp:
+            json.dump({'version': CONTINUATION_VERSION, 'configs': continuations}, fp)
+
+    def _config_root(self, config):
+        path_name = config['name'].replace('\\\\', '\\')
+        return os.path.expandvars(path_name)
 
-    def _load_dir(self, i, config):
+    def _scan_config(self, i, config, snapshots, stats, listings, shared_prefixes, continuations, resume=None):
 
         if config['name'] is None:
             self.warn("No 'name' provided for config #{}".format(i + 1))
-            return 0
+            return
 
-        path_name = config['name'].replace('\\\\', '\\')
-        root_path = os.path.expandvars(path_name)
+        root_path = self._config_root(config)
         if not os.path.exists(root_path):
-            self.warn("Path '{}' in config #{} does not exist".format(path_name, i + 1))
-            return 0
+            self.warn("Path '{}' in config #{} does not exist".format(config['name'], i + 1))
+            return
+
+        # Snapshots are keyed by the whole config since cached listings
+        # depend on its file types and depth
+        snapshot_key = json.dumps(config, sort_keys=True)
+        snapshots[snapshot_key] = {}
 
-        paths = self._scan_directory(root_path,
-                                     config['types'].split(','),
-                                     config['excludedirs'].split(','),
-                                     config['indexdirs'],
-                                     config['depth'])
+        # Picks up a scan suspended by maxtime: the paths found by the last
+        # passes are kept, and only the directories left are walked
+        previous, frontier = resume if resume is not None else ((), None)
+        if frontier:
+            snapshots[snapshot_key].update(self.snapshots.get(snapshot_key, {}))
+            stats.resumed = True
+            in_frontier = directory_filter(dir_path for dir_path, _ in frontier)
+            for dir_path, name in previous:
+                if not in_frontier(dir_path):
+                    stats.items += 1
+                    yield dir_path, name
 
+        continuation = []
+        start_time = time.time()
+        yield from self._scan_directory(root_path, ScanOptions(config, root_path),
+                                        snapshot=self.snapshots.get(snapshot_key),
+                                        new_snapshot=snapshots[snapshot_key],
+                                        stats=stats,
+                                        listings=listings,
+                                        shared_prefixes=shared_prefixes,
+                                        frontier=frontier,
+                                        continuation=continuation)
+        stats.elapsed = time.time() - start_time
+        if continuation:
+            continuations[config_keys(self.dir_configs)[i]] = continuation
+
+            # Until they are walked, the directories left keep the paths and
+            # listings found by the last scan
+            in_continuation = directory_filter(dir_path for dir_path, _ in continuation)
+            for dir_path, entry in self.snapshots.get(snapshot_key, {}).items():
+                if in_continuation(dir_path):
+                    snapshots[snapshot_key].setdefault(dir_path, entry)
+            for dir_path, name in previous:
+                if in_continuation(dir_path):
+                    stats.items += 1
+                    yield dir_path, name
 
-        self.merge_catalog([
+    def _scan_batches(self, paths):
+        """
+        Groups scanned paths into lists of at most batch_size paths.
+        """
+        paths = iter(paths)
+        while True:
+            batch = list(itertools.islice(paths, self.batch_size))
+            if not batch:
+                return
+            yield batch
+
+    def _queue_batches(self, i, config, snapshots, stats, listings, shared_prefixes, continuations, resume,
+                       batches, cancel):
+        """
+        Scans a config on a worker thread, handing its batches over to the
+        main thread through the batches queue. None marks the end of the scan.
+        The scan stops once cancel is set, as nothing reads the queue anymore.
+        """
+        try:
+            scan = self._scan_config(i, config, snapshots, stats, listings, shared_prefixes, continuations, resume)
+            for batch in self._scan_batches(scan):
+                if not self._put_batch(batches, batch, cancel):
+                    return
+        finally:
+            self._put_batch(batches, None, cancel)
+
+    @staticmethod
+    def _put_batch(batches, batch, cancel):
+        while not cancel.is_set():
+            try:
+                batches.put(batch, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _create_items(self, paths):
+        return [
             self.create_item(
                 category=kp.ItemCategory.FILE,
-                label=os.path.basename(path) or path,
+                label=name or os.path.basename(dir_path) or dir_path,
                 short_desc="",
-                target=os.path.join(root_path, path),
+                target=join_path(dir_path, name),
                 args_hint=kp.ItemArgsHint.ACCEPTED,
                 hit_hint=kp.ItemHitHint.KEEPALL)
-            for path in paths])
+            for dir_path, name in paths]
+
+    def _load_dir(self, key, batches, index, catalog=None, stats=None, seen=None, shared_prefixes=()):
+        """
+        Adds scanned batches of paths to the catalog, or to the catalog list
+        if one is given, and records them in the index file.
 
-        return len(paths)
+        Paths under shared_prefixes can also be found by other configs. They
+        are recorded in seen, and skipped if an earlier config had them.
+        """
+        count = 0
+        last_dir = None
+        index.write('>{}\n'.format(key))
+        for paths in batches:
+            if shared_prefixes:
+                paths = self._skip_duplicates(paths, seen, shared_prefixes, stats)
+            lines, last_dir = format_index_lines(paths, last_dir)
+            index.writelines(lines)
+            items = self._create_items(paths)
+            if catalog is None:
+                self.merge_catalog(items)
+            else:
+                catalog.extend(items)
+            count += len(paths)
+
+        return count
+
+    def _skip_duplicates(self, paths, seen, shared_prefixes, stats):
+        unique_paths = []
+        last_dir = shared = None
+        for dir_path, name in paths:
+            if dir_path != last_dir:
+                last_dir = dir_path
+                shared = normalize_dir(dir_path).startswith(shared_prefixes)
+            if shared:
+                key = os.path.normcase(join_path(dir_path, name))
+                if key in seen:
+                    stats.duplicates += 1
+                    continue
+                seen.add(key)
+            unique_paths.append((dir_path, name))
+        return unique_paths
+
+    def _owned_paths(self, keys, shared_prefixes):
+        """
+        Returns the paths under shared_prefixes that the catalog has for the
+        configs with the given keys, in the form used by _skip_duplicates().
+        """
+        seen = set()
+        for key in keys:
+            last_dir = shared = None
+            for dir_path, name in self.catalog_paths.get(key, []):
+                if dir_path != last_dir:
+                    last_dir = dir_path
+                    shared = normalize_dir(dir_path).startswith(shared_prefixes)
+                if shared:
+                    seen.add(os.path.normcase(join_path(dir_path, name)))
+        return seen
+
+    def _load_index(self):
+        """
+        Reads the paths cataloged by the last complete scan into a PathTable
+        per config, keyed as by config_keys().
+        """
+        index = {}
+        cache_path = self.get_package_cache_path(create=True)
+        index_path = os.path.join(cache_path, 'index.gz')
+        if not os.path.exists(index_path):
+            return index
+
+        try:
+            with gzip.open(index_path, 'rt', encoding='utf-8') as fp:
+                if fp.readline() != 'launchy-index {}\n'.format(INDEX_VERSION):
+                    return index
+
+                paths = dir_path = None
+                for line in fp:
+                    line = line[:-1]
+                    if line.startswith('>'):
+                        paths = index.setdefault(line[1:], PathTable())
+                        dir_path = None
+                    elif line.startswith('|'):
+                        dir_path = line[1:]
+                    elif paths is not None and dir_path is not None:
+                        paths.add(dir_path, line)
+        except (OSError, EOFError, UnicodeDecodeError) as e:
+            self.warn('Failed to load catalog index: {}'.format(e))
+            return {}
+
+        return index
+
+    def _write_index(self, index, paths):
+        """
+        Writes the index of the catalog made of the given paths, a mapping
+        of config keys to their (directory, name) pairs.
+        """
+        index.write('launchy-index {}\n'.format(INDEX_VERSION))
+        for key in config_keys(self.dir_configs):
+            index.write('>{}\n'.format(key))
+            index.writelines(format_index_lines(paths.get(key, []))[0])
+
+    def _warm_start(self):
+        """
+        Publishes the catalog of the last scan right away, so items can be
+        searched while the first scan is running.
+        """
+        index = self._load_index()
+        items = []
+        for key in config_keys(self.dir_configs):
+            items.extend(self._create_items(index.get(key, [])))
+
+        if items:
+            self.set_catalog(items)
+            digest = IndexWriter()
+            self._write_index(digest, index)
+            self.catalog_hash = digest.hexdigest()
+            self.info("Restored {} items from the last scan".format(len(items)))
 
     def on_start(self):
         self._update_config()
+        self._load_snapshots()
+        self._warm_start()
 
-    def on_catalog(self):
+    def _scan_all(self, snapshots, index, catalog, scan_stats, reused, resumed, continuations):
+        """
+        Scans every config and loads its items, returning the item count.
+        Configs found in reused are not scanned, their paths from the last
+        scan are loaded instead. Configs with a maxtime get their (paths,
+        frontier) from resumed: the paths of their last scan, and where to
+        resume it if it was suspended. The frontier of the scans suspended
+        during this pass are added to continuations.
+        """
         catalog_size = 0
-        self.set_catalog([])
-        start_time = time.time()
+        sources = {}
+        keys = config_keys(self.dir_configs)
+
+        # Entries whose trees overlap share the listings of their common
+        # directories, and their common items are only cataloged once
+        overlaps = find_overlaps(dict(
+            (i, self._config_root(config))
+            for i, config in enumerate(self.dir_configs)
+            if config['name'] is not None))
+        listings = {}
+        seen = set()
+
+        # Paths kept in the index were deduplicated against the other
+        # overlapping entries, so they can only be reused along with them
+        if any(i not in reused for i in overlaps):
+            reused = dict((i, paths) for i, paths in reused.items() if i not in overlaps)
 
         for i, config in enumerate(self.dir_configs):
-            catalog_size += self._load_dir(i, config)
+            scan_stats.append(ScanStats(i, config['name']))
+            if i in reused:
+                snapshot_key = json.dumps(config, sort_keys=True)
+                snapshots[snapshot_key] = self.snapshots.get(snapshot_key, {})
+                scan_stats[i].reused = True
+                scan_stats[i].items = len(reused[i])
+                sources[i] = self._scan_batches(iter(reused[i]))
+
+        if self.scan_threads > 1:
+            # Configs are mostly bound by disk and network latency, so scanning
+            # them concurrently helps when they live on different drives.
+            # Batches are still merged in config order, and the bounded queues
+            # keep workers from getting too far ahead of the catalog.
+            cancel = threading.Event()
+            with ThreadPoolExecutor(max_workers=self.scan_threads) as executor:
+                futures = []
+                for i, config in enumerate(self.dir_configs):
+                    if i in sources:
+                        continue
+                    batches = queue.Queue(maxsize=SCAN_QUEUE_SIZE)
+                    sources[i] = iter(batches.get, None)
+                    futures.append(executor.submit(
+                        self._queue_batches, i, config, snapshots, scan_stats[i],
+                        listings, overlaps.get(i, ()), continuations, resumed.get(i), batches, cancel))
+
+                try:
+                    for i, key in enumerate(keys):
+                        catalog_size += self._load_dir(key, sources[i], index, catalog,
+                                                       scan_stats[i], seen, overlaps.get(i, ()))
+                finally:
+                    # If loading failed, workers must not wait forever for the
+                    # queues to be read, or the executor would never shut down
+                    cancel.set()
+                for future in futures:
+                    future.result()
+        else:
+            for i, config in enumerate(self.dir_configs):
+                if i not in sources:
+                    scan = self._scan_config(i, config, snapshots, scan_stats[i], listings, overlaps.get(i, ()),
+                                             continuations, resumed.get(i))
+                    sources[i] = self._scan_batches(scan)
+                catalog_size += self._load_dir(keys[i], sources[i], index, catalog,
+                                               scan_stats[i], seen, overlaps.get(i, ()))
+
+        return catalog_size
+
+    def on_catalog(self):
+        with self.catalog_lock:
+            self._catalog()
+        self._update_watcher()
+
+    def _catalog(self, unchanged=()):
+        """
+        Rebuilds the catalog. Configs whose key is in unchanged are reloaded
+        from the index of the last scan instead of being scanned again, and
+        scans suspended by maxtime are resumed.
+        """
+        start_time = time.time()
+
+        reused = {}
+        resumed = {}
+        frontiers = self._load_continuations()
+        if unchanged or any(config['maxtime'] for config in self.dir_configs):
+            index_paths = self._load_index()
+            for i, (config, key) in enumerate(zip(self.dir_configs, config_keys(self.dir_configs))):
+                if key not in index_paths:
+                    continue
+                if config['maxtime']:
+                    resumed[i] = (index_paths[key], frontiers.get(key))
+                elif key in unchanged:
+                    reused[i] = index_paths[key]
+
+        # Once a catalog was published, keep its items searchable and build
+        # the new one aside. Otherwise, items are published as they are found.
+        catalog = [] if self.catalog_hash is not None else None
+        if catalog is None:
+            self.set_catalog([])
+
+        cache_path = self.get_package_cache_path(create=True)
+        index_path = os.path.join(cache_path, 'index.gz')
+        snapshots = {}
+        scan_stats = []
+        continuations = {}
+        with gzip.open(index_path + '.tmp', 'wt', encoding='utf-8') as fp:
+            index = IndexWriter(fp)
+            index.write('launchy-index {}\n'.format(INDEX_VERSION))
+            catalog_size = self._scan_all(snapshots, index, catalog, scan_stats, reused, resumed, continuations)
+
+        # Only publish and index a complete scan, and only swap catalogs when
+        # the content changed
+        if self.should_terminate():
+            os.remove(index_path + '.tmp')
+        else:
+            os.replace(index_path + '.tmp', index_path)
+            self._save_continuations(continuations)
+            if catalog is not None and index.hexdigest() == self.catalog_hash:
+                self.info("Catalog unchanged, keeping the current items")
+            elif catalog is not None:
+                self.set_catalog(catalog)
+            self.catalog_hash = index.hexdigest()
+
+        # Only keep snapshots for configs that still exist
+        self.snapshots = snapshots
+        self._save_snapshots()
+
+        # The watcher applies its changes to the paths of this scan, which
+        # must be in place before the lock is released
+        if self.watch:
+            self.catalog_paths = self._load_index()
+
+        for stats in scan_stats:
+            self.info(str(stats))
+        if self.dump_stats:
+            stats_path = os.path.join(cache_path, 'scan_stats.json')
+            with open(stats_path, 'w') as fp:
+                json.dump([stats.as_dict() for stats in scan_stats], fp, indent=2)
 
         elapsed = time.time() - start_time
         stat_msg = "Cataloged {} items in {:0.1f} seconds"
         self.info(stat_msg.format(catalog_size, elapsed))
 
+    def _save_index(self):
+        """
+        Writes the paths of the current catalog to the index, as kept up to
+        date by the watcher.
+        """
+        cache_path = self.get_package_cache_path(create=True)
+        index_path = os.path.join(cache_path, 'index.gz')
+        with gzip.open(index_path + '.tmp', 'wt', encoding='utf-8') as fp:
+            index = IndexWriter(fp)
+            self._write_index(index, self.catalog_paths)
+        os.replace(index_path + '.tmp', index_path)
+        self.catalog_hash = index.hexdigest()
+
+    def _update_watcher(self):
+        """
+        Starts, restarts or stops the watcher to follow the configuration,
+        and points it at the directories of the last scan.
+        """
+        settings = (self.watch_backend, self.watch_delay, self.watch_interval)
+        old_watcher = None
+        with self.catalog_lock:
+            if self.watcher and (not self.watch or settings != self.watcher_settings):
+                old_watcher, self.watcher = self.watcher, None
+                old_watcher.stop()
+
+        # Joined outside of the lock, which its callback may be waiting for.
+        # The changes it still reports are ignored, as it was replaced.
+        if old_watcher is not None:
+            old_watcher.join()
+
+        with self.catalog_lock:
+            if not self.watch:
+                self.catalog_paths = None
+                return
+
+            if self.catalog_paths is None:
+                self.catalog_paths = self._load_index()
+            if self.watcher is None:
+                self.watcher = watcher.create_watcher(
+                    self.watch_backend, self._on_directories_changed, self.watch_delay, self.watch_interval,
+                    self.warn, self.should_terminate)
+                self.watcher_settings = settings
+                self.watcher.start()
+                self.info("Watching directories using {}".format(type(self.watcher).__name__))
+            self._watch_directories()
+
+    def _watch_directories(self):
+        roots = []
+        dirs = {}
+        for config in self.dir_configs:
+            snapshot = self.snapshots.get(json.dumps(config, sort_keys=True))
+            if snapshot:
+                roots.append(self._config_root(config).rstrip(os.path.sep))
+                dirs.update((path, entry[0]) for path, entry in snapshot.items())
+        if self.watcher is not None:
+            self.watcher.watch(roots, dirs)
+
+    def _update_directory(self, options, dir_path, snapshot, added, removed, removed_dirs):
+        """
+        Lists again a directory of a config that changed, updating its
+        snapshot. Paths that appeared are added to added as (directory, name)
+        pairs, the paths of files that disappeared to removed, and those of
+        subdirectories that disappeared to removed_dirs. New subdirectories
+        are scanned.
+        """
+        root_path = options.root_path
+        relative_path = os.path.relpath(dir_path, root_path)
+        level = 0 if relative_path == os.curdir else relative_path.count(os.path.sep) + 1
+        stats = ScanStats(0, root_path)
+        _, old_files, old_subdirs = snapshot[dir_path]
+        try:
+            mtime = os.stat(dir_path).st_mtime_ns
+            files, subdirs = self._list_directory(dir_path,
+                                                  options.match_name,
+                                                  options.max_level == -1 or level < options.max_level,
+                                                  stats,
+                                                  follow_links=options.follow_links,
+                                                  match_exe=options.match_exe)
+        except OSError:
+            # The directory is gone, this is handled with its parent
+            return
+
+        snapshot[dir_path] = [mtime, files, subdirs]
+        ignore = options.ignore
+        old_files = set(old_files)
+        added.extend((dir_path, name) for name in files
+                     if name not in old_files and not (ignore and ignore.match(dir_path, name, False)))
+        removed.update(os.path.join(dir_path, name) for name in old_files.difference(files))
+
+        for name in set(old_subdirs).difference(subdirs):
+            subdir_path = os.path.join(dir_path, name)
+            removed_dirs.append(subdir_path)
+            prefix = os.path.join(subdir_path, '')
+            for path in [path for path in snapshot if path == subdir_path or path.startswith(prefix)]:
+                del snapshot[path]
+
+        old_subdirs = set(old_subdirs)
+        for name in subdirs:
+            subdir_path = os.path.join(dir_path, name)
+            if name in old_subdirs or options.exclude.match_child(dir_path, name) or not os.path.isdir(subdir_path):
+                continue
+            if ignore and ignore.match(dir_path, name, True):
+                continue
+            try:
+                if options.same_device and os.stat(subdir_path).st_dev != os.stat(root_path).st_dev:
+                    continue
+            except OSError:
+                # Removed in the meantime, the next change will tell
+                continue
+            added.extend(self._scan_directory(subdir_path, options,
+                                              new_snapshot=snapshot,
+                                              stats=stats,
+                                              start_level=level + 1))
+
+    def _on_directories_changed(self, changed):
+        """
+        Called by the watcher with the directories whose content changed.
+        Added items are merged into the catalog, which is only replaced when
+        items have to be removed.
+        """
+        if self.should_terminate():
+            # The plugin is being unloaded, leave its catalog alone. The
+            # watcher checks should_terminate() too and stops right after.
+            return
+
+        with self.catalog_lock:
+            current = threading.current_thread()
+            if isinstance(current, watcher.Watcher) and current is not self.watcher:
+                return
+            if self.catalog_paths is None:
+                return
+
+            num_added = num_removed = 0
+            added_items = []
+            keys = config_keys(self.dir_configs)
+            overlaps = find_overlaps(dict(
+                (i, self._config_root(config))
+                for i, config in enumerate(self.dir_configs)
+                if config['name'] is not None))
+            for i, (config, key) in enumerate(zip(self.dir_configs, keys)):
+                snapshot = self.snapshots.get(json.dumps(config, sort_keys=True))
+                paths = self.catalog_paths.get(key)
+                if snapshot is None or paths is None:
+                    continue
+
+                root_path = self._config_root(config).rstrip(os.path.sep)
+                added, removed, removed_dirs = [], set(), []
+                options = None
+                for dir_path in sorted(changed):
+                    if dir_path in snapshot:
+                        if options is None:
+                            # The limits apply to the whole entry, below
+                            options = ScanOptions(config, root_path)
+                            options.max_items = options.max_time = 0
+                        self._update_directory(options, dir_path, snapshot, added, removed, removed_dirs)
+
+                if removed or removed_dirs:
+                    removed.update(removed_dirs)
+                    prefixes = tuple(os.path.join(path, '') for path in removed_dirs)
+                    count = len(paths)
+                    paths = PathTable(
+                        (dir_path, name) for dir_path, name in paths
+                        if join_path(dir_path, name) not in removed
+                        and not os.path.join(dir_path, '').startswith(prefixes))
+                    self.catalog_paths[key] = paths
+                    num_removed += count - len(paths)
+
+                # As with scans, paths shared with overlapping entries belong
+                # to the first entry having them
+                shared_prefixes = overlaps.get(i, ())
+                if shared_prefixes and added:
+                    seen = self._owned_paths(keys[:i], shared_prefixes)
+                    added = self._skip_duplicates(added, seen, shared_prefixes, ScanStats(i, root_path))
+
+                # Same limit as the scans, the next one decides which paths
+                # are kept (the shallowest ones)
+                room = config['maxitems'] - len(paths)
+                if config['maxitems'] and len(added) > room:
+                    self.warn("Not adding {} items to '{}', which reached the limit of {} items".format(
+                        len(added) - max(room, 0), root_path, config['maxitems']))
+                    added = added[:max(room, 0)]
+
+                for dir_path, name in added:
+                    paths.add(dir_path, name)
+                num_added += len(added)
+                added_items.extend(self._create_items(added))
+
+            if not num_added and not num_removed:
+                return
+
+            if num_removed:
+                self.set_catalog([
+                    item
+                    for key in config_keys(self.dir_configs)
+                    for item in self._create_items(self.catalog_paths.get(key, []))])
+            else:
+                self.merge_catalog(added_items)
+
+            # The catalog is up to date even if the cache can't be written
+            # (e.g. locked by another process), it is written again on the
+            # next change or scan
+            try:
+                self._save_index()
+                self._save_snapshots()
+            except OSError as e:
+                self.warn('Failed to save the catalog index: {}'.format(e))
+            self._watch_directories()
+
+        self.info("Catalog updated: {} items added, {} removed".format(num_added, num_removed))
+
+    def _list_suggestions(self, dir_path):
+        """
+        Returns the items to suggest when browsing inside dir_path, or None
+        if it is not a directory. Listings are kept in a LRU cache and reused
+        as long as the directory's mtime does not change.
+        """
+        try:
+            dir_stat = os.stat(dir_path)
+        except OSError:
+            return None
+        if not stat.S_ISDIR(dir_stat.st_mode):
+            return None
+
+        cached = self.suggest_cache.get(dir_path)
+        if cached and cached[0] == dir_stat.st_mtime_ns:
+            self.suggest_cache.move_to_end(dir_path)
+            return cached[1]
+
+        suggestions = []
+        try:
+            entries = list(os.scandir(dir_path))
+        except OSError:
+            entries = []
+
+        for entry in entries:
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                is_dir = False
+
+            # Only directories can be browsed further
+            suggestions.append(self.create_item(
+                category=kp.ItemCategory.FILE,
+                label=entry.name,
+                short_desc="",
+                target=entry.path,
+                args_hint=kp.ItemArgsHint.ACCEPTED,
+                hit_hint=kp.ItemHitHint.KEEPALL,
+                loop_on_suggest=is_dir))
+
+        self.suggest_cache[dir_path] = (dir_stat.st_mtime_ns, suggestions)
+        self.suggest_cache.move_to_end(dir_path)
+        while len(self.suggest_cache) > self.suggest_cache_size:
+            self.suggest_cache.popitem(last=False)
+
+        return suggestions
+
     def on_suggest(self, user_input, items_chain):
         if not items_chain:
             return
 
         target_path = items_chain[-1].target()
-        if os.path.isdir(target_path):
-            suggestions = [
-                self.create_item(
-                    category=kp.ItemCategory.FILE,
-                    label=subdir,
-                    short_desc="",
-                    target=os.path.join(target_path, subdir),
-                    args_hint=kp.ItemArgsHint.ACCEPTED,
-                    hit_hint=kp.ItemHitHint.KEEPALL,
-                    loop_on_suggest=True)
-                for subdir in os.listdir(target_path)]
-        else:
+        suggestions = self._list_suggestions(target_path)
+        if suggestions is None:
             clone = items_chain[-1].clone()
             clone.set_args(user_input)
             suggestions = [clone]
@@ -166,5 +1401,16 @@ class Launchy(kp.Plugin):
 
     def on_events(self, flags):
         if flags & kp.Events.PACKCONFIG:
+            old_configs = self.dir_configs
             self._update_config()
-            self.on_catalog()
+            if self.dir_configs == old_configs:
+                self._update_watcher()
+                return
+
+            # Only scan added and modified entries, the items of removed
+            # entries are dropped when the catalog is replaced
+            unchanged = set(config_keys(old_configs))
+            unchanged.intersection_update(config_keys(self.dir_configs))
+            with self.catalog_lock:
+                self._catalog(unchanged)
+            self._update_watcher()
@@ -0,0 +1,308 @@
+"""
+Directory change watchers used to keep the Launchy catalog up to date.
+
+A watcher runs on its own thread and reports the directories whose content
+changed (files or subdirectories added, removed or renamed) to a callback.
+Bursts of changes are coalesced: the callback is only called once no new
+change was seen for `delay` seconds, or at the latest every `delay * 5`
+seconds while changes keep coming.
+
+Backends:
+    windows: FindFirstChangeNotification on each root, which tells which
+             root changed, then the mtimes of its directories to find which
+             ones did.
+    inotify: Linux inotify, one watch per directory.
+    polling: compares the mtimes of all directories every `interval` seconds.
+
+The directories to watch, along with their last known mtime, are set with
+:meth:`Watcher.watch`, and can be updated at any time. Errors are reported
+to the `warn` callback, the watcher keeps running. It stops by itself once
+the `should_stop` callback returns True (e.g. when the plugin is unloaded).
+"""
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import sys
+import threading
+import time
+
+BACKENDS = ('auto', 'windows', 'inotify', 'polling')
+
+
+class Watcher(threading.Thread):
+    """
+    Base class of the watchers, handling the thread and the coalescing of
+    changes. Backends implement _poll(timeout), which waits for at most
+    timeout seconds and returns the directories that changed.
+    """
+    def __init__(self, callback, delay=2.0, interval=30.0, warn=None, should_stop=None):
+        super().__init__(daemon=True)
+        self.callback = callback
+        self.delay = delay
+        self.interval = interval
+        self.warn = warn or (lambda message: None)
+        self.should_stop = should_stop or (lambda: False)
+        self.dirs = {}
+        self.roots = []
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+
+    def watch(self, roots, dirs):
+        """
+        Sets the root directories and the directories under them to watch.
+        dirs maps each directory path to its last known mtime (in ns).
+        """
+        with self._lock:
+            self.roots = list(roots)
+            self.dirs = dict(dirs)
+            self._update_watches()
+
+    def stop(self):
+        self._stopping.set()
+
+    def run(self):
+        pending = set()
+        first_change = last_change = 0
+        try:
+            while not self._stopping.is_set():
+                if self.should_stop():
+                    self.stop()
+                    break
+                try:
+                    timeout = self.delay if pending else self.interval
+                    changed = self._poll(timeout)
+
+                    now = time.time()
+                    if changed:
+                        if not pending:
+                            first_change = now
+                        pending.update(changed)
+                        last_change = now
+
+                    if pending and (now - last_change >= self.delay or
+                                    now - first_change >= self.delay * 5):
+                        changed, pending = pending, set()
+                        self.callback(changed)
+                except Exception as e:
+                    # The changes are lost, but the next ones are still
+                    # handled. Wait a bit so a failing poll doesn't spin.
+                    self.warn("Directory watcher error: {}".format(e))
+                    self._stopping.wait(self.delay)
+        finally:
+            self._close()
+
+    def _changed_dirs(self, roots=None, paths=None):
+        """
+        Finds the watched directories (under roots, or among paths, if given)
+        whose mtime changed, and remembers their new mtime.
+        """
+        with self._lock:
+            dirs = list(self.dirs.items())
+
+        if paths is not None:
+            dirs = [(d, mtime) for d, mtime in dirs if d in paths]
+        if roots is not None:
+            prefixes = tuple(os.path.join(root, '') for root in roots)
+            dirs = [(d, mtime) for d, mtime in dirs if d in roots or d.startswith(prefixes)]
+
+        changed = []
+        for path, mtime in dirs:
+            try:
+                new_mtime = os.stat(path).st_mtime_ns
+            except OSError:
+                new_mtime = None
+            if new_mtime != mtime:
+                changed.append(path)
+                with self._lock:
+                    self.dirs[path] = new_mtime
+
+        return changed
+
+    def _update_watches(self):
+        pass
+
+    def _poll(self, timeout):
+        raise NotImplementedError
+
+    def _close(self):
+        pass
+
+
+class PollingWatcher(Watcher):
+    def _poll(self, timeout):
+        if self._stopping.wait(min(timeout, self.interval)):
+            return []
+        return self._changed_dirs()
+
+
+class InotifyWatcher(Watcher):
+    MASK = (0x00000040 |  # IN_MOVED_FROM
+            0x00000080 |  # IN_MOVED_TO
+            0x00000100 |  # IN_CREATE
+            0x00000200 |  # IN_DELETE
+            0x00000400 |  # IN_DELETE_SELF
+            0x00000800)   # IN_MOVE_SELF
+    IN_IGNORED = 0x00008000
+    EVENT = struct.Struct('iIII')
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.wds = {}
+        # Directories that could not be watched (e.g. over max_user_watches)
+        # are polled every interval instead
+        self.unwatched = frozenset()
+        self.last_poll = time.time()
+
+    def _update_watches(self):
+        watched = set(self.wds.values())
+        unwatched = set()
+        error = None
+        for path in self.dirs:
+            if path not in watched:
+                wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), self.MASK)
+                if wd >= 0:
+                    self.wds[wd] = path
+                else:
+                    error = ctypes.get_errno()
+                    # Directories that are gone are handled with their parent
+                    if error != errno.ENOENT:
+                        unwatched.add(path)
+
+        if unwatched and len(unwatched) != len(self.unwatched):
+            self.warn("Could not watch {} directories ({}), polling them every {} seconds instead".format(
+                len(unwatched), os.strerror(error), self.interval))
+        self.unwatched = frozenset(unwatched)
+
+        for wd, path in list(self.wds.items()):
+            if path not in self.dirs:
+                self.libc.inotify_rm_watch(self.fd, wd)
+                del self.wds[wd]
+
+    def _poll(self, timeout):
+        changed = []
+        with self._lock:
+            unwatched = self.unwatched
+        if unwatched and time.time() - self.last_poll >= self.interval:
+            self.last_poll = time.time()
+            changed = self._changed_dirs(paths=unwatched)
+
+        # Wake up regularly to notice stop() calls
+        readable, _, _ = select.select([self.fd], [], [], min(timeout, 1.0))
+        if not readable:
+            return changed
+
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return changed
+
+        offset = 0
+        with self._lock:
+            while offset < len(data):
+                wd, mask, _, length = self.EVENT.unpack_from(data, offset)
+                offset += self.EVENT.size + length
+                path = self.wds.get(wd)
+                if path is None:
+                    continue
+                changed.append(path)
+                if mask & self.IN_IGNORED:
+                    del self.wds[wd]
+
+        return changed
+
+    def _close(self):
+        os.close(self.fd)
+
+
+class WindowsWatcher(Watcher):
+    FILE_NOTIFY_CHANGE_FILE_NAME = 0x00000001
+    FILE_NOTIFY_CHANGE_DIR_NAME = 0x00000002
+    INVALID_HANDLE_VALUE = ctypes.c_void_p(-1).value
+    MAXIMUM_WAIT_OBJECTS = 64
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        from ctypes import wintypes
+        self.kernel32 = ctypes.WinDLL('kernel32', use_last_error=True)
+        self.kernel32.FindFirstChangeNotificationW.argtypes = [wintypes.LPCWSTR, wintypes.BOOL, wintypes.DWORD]
+        self.kernel32.FindFirstChangeNotificationW.restype = wintypes.HANDLE
+        self.kernel32.FindNextChangeNotification.argtypes = [wintypes.HANDLE]
+        self.kernel32.FindCloseChangeNotification.argtypes = [wintypes.HANDLE]
+        self.kernel32.WaitForMultipleObjects.argtypes = [
+            wintypes.DWORD, ctypes.POINTER(wintypes.HANDLE), wintypes.BOOL, wintypes.DWORD]
+        self.kernel32.WaitForMultipleObjects.restype = wintypes.DWORD
+        self.handle_type = wintypes.HANDLE
+        self.handles = {}
+
+    def _update_watches(self):
+        flags = self.FILE_NOTIFY_CHANGE_FILE_NAME | self.FILE_NOTIFY_CHANGE_DIR_NAME
+        for root in self.roots[:self.MAXIMUM_WAIT_OBJECTS]:
+            if root not in self.handles:
+                handle = self.kernel32.FindFirstChangeNotificationW(root, True, flags)
+                if handle and handle != self.INVALID_HANDLE_VALUE:
+                    self.handles[root] = handle
+                else:
+                    self.warn("Could not watch {}: {}".format(root, ctypes.FormatError(ctypes.get_last_error())))
+
+        for root in list(self.handles):
+            if root not in self.roots:
+                self.kernel32.FindCloseChangeNotification(self.handles.pop(root))
+
+    def _poll(self, timeout):
+        with self._lock:
+            roots = list(self.handles)
+            handles = (self.handle_type * len(roots))(*(self.handles[root] for root in roots))
+
+        if not roots:
+            self._stopping.wait(timeout)
+            return []
+
+        # Wake up regularly to notice stop() calls
+        result = self.kernel32.WaitForMultipleObjects(len(roots), handles, False, int(min(timeout, 1.0) * 1000))
+        if result >= len(roots):
+            return []
+
+        root = roots[result]
+        self.kernel32.FindNextChangeNotification(handles[result])
+        return self._changed_dirs([root])
+
+    def _close(self):
+        with self._lock:
+            for handle in self.handles.values():
+                self.kernel32.FindCloseChangeNotification(handle)
+            self.handles = {}
+
+
+def create_watcher(backend, callback, delay=2.0, interval=30.0, warn=None, should_stop=None):
+    """
+    Creates a watcher using the given backend. With "auto", the native
+    backend of the platform is used if possible, and polling otherwise.
+    warn is called with a message when something goes wrong, and the
+    watcher stops once should_stop returns True.
+    """
+    if backend == 'auto':
+        if os.name == 'nt':
+            backend = 'windows'
+        elif sys.platform.startswith('linux'):
+            backend = 'inotify'
+        else:
+            backend = 'polling'
+
+    try:
+        if backend == 'windows':
+            return WindowsWatcher(callback, delay, interval, warn, should_stop)
+        if backend == 'inotify':
+            return InotifyWatcher(callback, delay, interval, warn, should_stop)
+    except (OSError, AttributeError):
+        # Native notifications are not available here
+        pass
+
+    return PollingWatcher(callback, delay, interval, warn, should_stop)
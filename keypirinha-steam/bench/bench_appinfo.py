@@ -0,0 +1,236 @@
+"""
+Benchmark for the appinfo.vdf parser.
+
+Parses a synthetic appinfo.vdf (or a real one with --file) outside of
+Keypirinha, reading it as a stream from the file object, from a bytes buffer
+and from a memory mapping of the file. Each mode is run over every app, and
+over a few selected apps like Steam.get_applist() does, both with the full
+app data and projected to the fields the plugin uses. It reports the time
+taken, apps and MB per second, and the peak memory allocated while parsing.
+
+Usage:
+    python bench_appinfo.py [--file PATH] [--apps N] [--version N] [--select N]
+                            [--repeat N] [--keep]
+"""
+
+import argparse
+import importlib
+import mmap
+import os
+import random
+import struct
+import sys
+import tempfile
+import time
+import tracemalloc
+import types
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+
+# Same projection as Steam.get_applist()
+FIELDS = {'appinfo.common.name', 'appinfo.common.type', 'appinfo.common.clienticon'}
+
+
+def load_lib():
+    # The plugin is a package in Keypirinha, its lib modules import each
+    # other relatively
+    package = types.ModuleType('steam_package')
+    package.__path__ = [SRC_DIR]
+    sys.modules['steam_package'] = package
+    return importlib.import_module('steam_package.lib.appcache'), importlib.import_module('steam_package.lib.vdf')
+
+
+def app_data(vdf, appid, rng):
+    """
+    Builds the data of an app, shaped like the records of a real
+    appinfo.vdf: a few common fields and larger config, depots and
+    localization sections.
+    """
+    common = {
+        'name': 'Game {}'.format(appid),
+        'type': rng.choice(['Game', 'Tool', 'DLC', 'Application', 'Demo']),
+        'gameid': vdf.UINT_64(appid),
+        'oslist': 'windows,macos',
+        'metacritic_score': rng.randint(0, 100),
+        'clienticon': '{:040x}'.format(rng.getrandbits(160)),
+    }
+    depots = {}
+    for depot in range(rng.randint(1, 16)):
+        depots[str(appid + depot)] = {
+            'name': 'Depot {}'.format(depot),
+            'config': {'oslist': 'windows', 'language': 'english'},
+            'manifests': {'public': {'gid': vdf.UINT_64(rng.getrandbits(63)), 'size': vdf.UINT_64(rng.getrandbits(32))}},
+            'maxsize': vdf.UINT_64(rng.getrandbits(32)),
+        }
+    launch = {}
+    for entry in range(rng.randint(1, 4)):
+        launch[str(entry)] = {'executable': 'bin/game{}.exe'.format(entry), 'arguments': '-novid', 'type': 'default'}
+    localization = {}
+    for language in ['french', 'german', 'spanish', 'japanese', 'russian'][:rng.randint(0, 5)]:
+        localization[language] = {'name': 'Game {} ({})'.format(appid, language)}
+
+    return {'appinfo': {
+        'appid': appid,
+        'common': common,
+        'extended': {'developer': 'Developer', 'publisher': 'Publisher', 'homepage': 'https://example.com'},
+        'config': {'installdir': 'Game{}'.format(appid), 'launch': launch},
+        'depots': depots,
+        'localization': localization,
+    }}
+
+
+def dump_with_key_table(vdf, obj, keys):
+    """
+    Serializes obj as a binary VDF whose keys are indexes into keys, as
+    stored by appinfo.vdf v29 and newer.
+    """
+    chunks = []
+
+    def key_index(key):
+        return struct.pack('<i', keys.setdefault(key, len(keys)))
+
+    def dump(obj):
+        for key, value in obj.items():
+            if isinstance(value, dict):
+                chunks.append(vdf.BIN_NONE + key_index(key))
+                dump(value)
+            elif isinstance(value, vdf.UINT_64):
+                chunks.append(vdf.BIN_UINT64 + key_index(key) + struct.pack('<Q', value))
+            elif isinstance(value, str):
+                chunks.append(vdf.BIN_STRING + key_index(key) + value.encode('utf-8') + b'\x00')
+            else:
+                chunks.append(vdf.BIN_INT32 + key_index(key) + struct.pack('<i', value))
+        chunks.append(vdf.BIN_END)
+
+    dump(obj)
+    return b''.join(chunks)
+
+
+def generate_appinfo(vdf, path, num_apps, version, seed=0):
+    """
+    Writes a synthetic appinfo.vdf with num_apps apps, in the format of the
+    given version (39: "'DV\\x07", 40: "(DV\\x07", 41: ")DV\\x07").
+    Returns the appids written.
+    """
+    rng = random.Random(seed)
+    appids = sorted(rng.sample(range(10, num_apps * 20), num_apps))
+    keys = {}
+    sections = []
+    for appid in appids:
+        data = app_data(vdf, appid, rng)
+        if version >= 41:
+            data = dump_with_key_table(vdf, data, keys)
+        else:
+            data = vdf.binary_dumps(data)
+        section = struct.pack('<IIQ', 2, int(time.time()), 0) + os.urandom(20) + struct.pack('<I', appid)
+        if version >= 40:
+            section += os.urandom(20)
+        section += data
+        sections.append(struct.pack('<II', appid, len(section)) + section)
+    sections.append(struct.pack('<I', 0))
+    body = b''.join(sections)
+
+    header = bytes([version]) + b'DV\x07' + struct.pack('<I', 1)
+    with open(path, 'wb') as fp:
+        if version >= 41:
+            fp.write(header + struct.pack('<q', len(header) + 8 + len(body)))
+            fp.write(body)
+            fp.write(struct.pack('<I', len(keys)))
+            fp.write(b''.join(key.encode('utf-8') + b'\x00' for key in keys))
+        else:
+            fp.write(header + body)
+
+    return appids
+
+
+def parse(appcache, path, mode, appids, fields):
+    with open(path, 'rb') as fp:
+        if mode == 'stream':
+            _, apps = appcache.parse_appinfo(fp, dict, appids=appids, fields=fields)
+            return sum(1 for _ in apps)
+        if mode == 'bytes':
+            _, apps = appcache.parse_appinfo(fp.read(), dict, appids=appids, fields=fields)
+            return sum(1 for _ in apps)
+        with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            _, apps = appcache.parse_appinfo(buf, dict, appids=appids, fields=fields)
+            return sum(1 for _ in apps)
+
+
+def run_case(appcache, path, mode, appids, fields, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        count = parse(appcache, path, mode, appids, fields)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+
+    # Tracing allocations slows parsing down a lot, so memory is measured
+    # on a separate run
+    tracemalloc.start()
+    parse(appcache, path, mode, appids, fields)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return best, count, peak
+
+
+def list_appids(appcache, path):
+    with open(path, 'rb') as fp:
+        _, apps = appcache.parse_appinfo(fp.read(), dict)
+        return [app['appid'] for app in apps]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--file', help="parse this appinfo.vdf instead of a generated one")
+    parser.add_argument('--apps', type=int, default=5000, help="apps in the generated file")
+    parser.add_argument('--version', type=int, default=41, choices=[39, 40, 41],
+                        help="format of the generated file (41 has a key table)")
+    parser.add_argument('--select', type=int, default=20, help="apps picked for the selective runs")
+    parser.add_argument('--repeat', type=int, default=3, help="runs per case, the fastest is reported")
+    parser.add_argument('--keep', action='store_true', help="keep the generated file")
+    args = parser.parse_args()
+
+    appcache, vdf = load_lib()
+    path = args.file
+    if path is None:
+        fd, path = tempfile.mkstemp(prefix='appinfo-bench-', suffix='.vdf')
+        os.close(fd)
+    try:
+        if args.file is None:
+            appids = generate_appinfo(vdf, path, args.apps, args.version)
+        else:
+            appids = list_appids(appcache, path)
+        size = os.path.getsize(path)
+        print("File: {} apps, {:.1f} MB".format(len(appids), size / 1e6))
+
+        # Spread the selected apps over the whole file, the last one
+        # included, like installed games would be
+        selected = appids[::max(1, len(appids) // args.select)][:args.select - 1] + appids[-1:]
+
+        cases = [
+            ('all', None, None),
+            ('selected', selected, None),
+            ('all, projected', None, FIELDS),
+            ('selected, projected', selected, FIELDS),
+        ]
+
+        header = "{:<28} {:>9} {:>7} {:>11} {:>8} {:>10}"
+        row = "{:<28} {:>9.3f} {:>7} {:>11,.0f} {:>8.1f} {:>10.1f}"
+        print(header.format('case', 'seconds', 'apps', 'apps/sec', 'MB/sec', 'peak KiB'))
+        for mode in ('stream', 'bytes', 'mmap'):
+            for name, wanted, fields in cases:
+                elapsed, count, peak = run_case(appcache, path, mode, wanted, fields, args.repeat)
+                print(row.format('{} ({})'.format(mode, name), elapsed, count, count / elapsed,
+                                 size / 1e6 / elapsed, peak / 1024))
+    finally:
+        if args.file is None:
+            if args.keep:
+                print("File kept in {}".format(path))
+            else:
+                os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -38,18 +38,60 @@ Appache file parsing examples:
 
 """
 
+import json
 import struct
-from .vdf import binary_load
+import sys
+from .vdf import binary_load, binary_loads_from, BUFFER_TYPES
 
 uint32 = struct.Struct('<I')
 uint64 = struct.Struct('<Q')
 int64 = struct.Struct('<q')
 
-def parse_appinfo(fp, mapper=None):
+class _BufferReader(object):
+    """File-like cursor over a buffer. Section headers are read through it,
+    while binary VDFs are parsed in place with :func:`binary_loads_from`"""
+    def __init__(self, buf):
+        self.buf = buf.tobytes() if isinstance(buf, memoryview) else buf
+        self.pos = 0
+
+    def read(self, size=-1):
+        end = len(self.buf) if size < 0 else self.pos + size
+        data = self.buf[self.pos:end]
+        self.pos += len(data)
+        return bytes(data)
+
+    def seek(self, offset, whence=0):
+        if whence == 1:
+            offset += self.pos
+        elif whence == 2:
+            offset += len(self.buf)
+        self.pos = offset
+
+    def tell(self):
+        return self.pos
+
+def _load_vdf(fp, **kwargs):
+    if isinstance(fp, _BufferReader):
+        data, fp.pos = binary_loads_from(fp.buf, fp.pos, **kwargs)
+        return data
+    return binary_load(fp, **kwargs)
+
+def parse_appinfo(fp, mapper=None, appids=None, fields=None, offsets=None):
     """Parse appinfo.vdf from the Steam appcache folder
 
-    :param fp: file-like object
+    :param fp: file-like object, or buffer (e.g. :class:`bytes` or :class:`mmap.mmap`)
+               to parse in place, which is much faster
     :param mapper: Python object class to return
+    :param appids: only parse the apps with these ids, skipping the others
+                   and stopping once all of them were found
+    :type appids: iterable of :class:`int`
+    :param fields: only keep these key paths of the app data, as tuples of keys or
+                   dotted strings (e.g. ``'appinfo.common.name'``), skipping the rest
+    :type fields: iterable
+    :param offsets: offsets of the app sections (see :func:`index_appinfo`), to seek
+                    straight to the apps in ``appids`` instead of scanning the file.
+                    Apps missing from it are not looked for.
+    :type offsets: :class:`dict`
     :raises: SyntaxError
     :rtype: (:class:`Generator` returning :class:`dict` by default or mapper class if set)
     :return: (header, apps iterator)
@@ -60,7 +102,7 @@ def parse_appinfo(fp, mapper=None):
 #   int64    - OFFSET TO KEY TABLE (added in ")DV\x07")
 #   ---- repeated app sections ----
 #   uint32   - AppID
-#   uint32   - size
+#   uint32   - size (of the rest of the section)
 #   uint32   - infoState
 #   uint32   - lastUpdated
 #   uint64   - accessToken
@@ -75,6 +117,9 @@ def parse_appinfo(fp, mapper=None):
 #   uint32   - Count of keys
 #   char[]   - Null-terminated strings corresponding to field names
 
+    if isinstance(fp, BUFFER_TYPES):
+        fp = _BufferReader(fp)
+
     magic = fp.read(4)
     if magic not in (b"'DV\x07", b"(DV\x07", b")DV\x07"):
         raise SyntaxError("Invalid magic, got %s" % repr(magic))
@@ -88,55 +133,74 @@ def parse_appinfo(fp, mapper=None):
         # appinfo.vdf V29 and newer store list of keys in separate table at the
         # end of the file to reduce size. Retrieve it and pass it to the VDF
         # parser later.
-        key_table = []
-
         key_table_offset = struct.unpack('q', fp.read(8))[0]
         offset = fp.tell()
         fp.seek(key_table_offset)
         key_count = uint32.unpack(fp.read(4))[0]
 
-        # Read all null-terminated strings into a list
-        for _ in range(0, key_count):
-            field_name = bytearray()
-            while True:
-                field_name += fp.read(1)
-
-                if field_name[-1] == 0:
-                    field_name = field_name[0:-1]
-                    field_name = field_name.decode("utf-8", "replace")
-
-                    key_table.append(field_name)
-                    break
+        # Read all null-terminated strings at once, the table runs to the
+        # end of the file. Keys are interned, so that all the apps share them.
+        names = fp.read().split(b'\x00', key_count)
+        if len(names) <= key_count:
+            raise SyntaxError("Unterminated key in key table (offset: %d)" % key_table_offset)
+        key_table = [sys.intern(name.decode("utf-8", "replace")) for name in names[:key_count]]
 
         # Rewind to the beginning of the file after the header:
         # we can now parse the rest of the file.
         fp.seek(offset)
 
+    wanted = set(appids) if appids is not None else None
+
     def apps_iter():
-        while True:
+        if offsets is not None:
+            for appid in (offsets if wanted is None else wanted):
+                if appid not in offsets:
+                    continue
+
+                fp.seek(offsets[appid])
+                found, size = uint32.unpack(fp.read(4))[0], uint32.unpack(fp.read(4))[0]
+                if found != appid:
+                    raise SyntaxError("Expected app %d at offset %d, got %d" % (appid, offsets[appid], found))
+
+                yield read_app(appid, size)
+            return
+
+        while wanted is None or wanted:
             appid = uint32.unpack(fp.read(4))[0]
 
             if appid == 0:
                 break
 
-            app = {
-                'appid': appid,
-                'size': uint32.unpack(fp.read(4))[0],
-                'info_state': uint32.unpack(fp.read(4))[0],
-                'last_updated': uint32.unpack(fp.read(4))[0],
-                'access_token': uint64.unpack(fp.read(8))[0],
-                'sha1': fp.read(20),
-                'change_number': uint32.unpack(fp.read(4))[0],
-            }
+            size = uint32.unpack(fp.read(4))[0]
 
-            if magic != b"'DV\x07":
-                app['data_sha1'] = fp.read(20)
+            # skip the apps we were not asked for without parsing them
+            if wanted is not None:
+                if appid not in wanted:
+                    fp.seek(size, 1)
+                    continue
+                wanted.discard(appid)
 
-            # 'key_table' will be None for older 'appinfo.vdf' files which
-            # use self-contained binary VDFs.
-            app['data'] = binary_load(fp, key_table=key_table, mapper=mapper)
+            yield read_app(appid, size)
 
-            yield app
+    def read_app(appid, size):
+        app = {
+            'appid': appid,
+            'size': size,
+            'info_state': uint32.unpack(fp.read(4))[0],
+            'last_updated': uint32.unpack(fp.read(4))[0],
+            'access_token': uint64.unpack(fp.read(8))[0],
+            'sha1': fp.read(20),
+            'change_number': uint32.unpack(fp.read(4))[0],
+        }
+
+        if magic != b"'DV\x07":
+            app['data_sha1'] = fp.read(20)
+
+        # 'key_table' will be None for older 'appinfo.vdf' files which
+        # use self-contained binary VDFs.
+        app['data'] = _load_vdf(fp, key_table=key_table, mapper=mapper, fields=fields)
+
+        return app
 
 
     return ({
@@ -146,10 +210,193 @@ def parse_appinfo(fp, mapper=None):
             apps_iter()
             )
 
+def index_appinfo(fp, start=None):
+    """Find the app sections of appinfo.vdf, without parsing them
+
+    :param fp: file-like object, or buffer (e.g. :class:`bytes` or :class:`mmap.mmap`)
+    :param start: offset of the section to start from, instead of the first one
+    :type start: :class:`int`
+    :raises: SyntaxError
+    :rtype: (:class:`Generator` returning (appid, offset, size, change_number) tuples)
+    :return: (header, sections iterator)
+    """
+    if isinstance(fp, BUFFER_TYPES):
+        fp = _BufferReader(fp)
+
+    magic = fp.read(4)
+    if magic not in (b"'DV\x07", b"(DV\x07", b")DV\x07"):
+        raise SyntaxError("Invalid magic, got %s" % repr(magic))
+
+    universe = uint32.unpack(fp.read(4))[0]
+
+    if magic[0] >= 41:
+        fp.seek(8, 1)  # key table offset
+    if start is not None:
+        fp.seek(start)
+
+    def sections_iter():
+        while True:
+            offset = fp.tell()
+            appid = uint32.unpack(fp.read(4))[0]
+
+            if appid == 0:
+                break
+
+            size = uint32.unpack(fp.read(4))[0]
+            fp.seek(36, 1)  # infoState, lastUpdated, accessToken, SHA1
+            change_number = uint32.unpack(fp.read(4))[0]
+            fp.seek(offset + 8 + size)
+
+            yield appid, offset, size, change_number
+
+
+    return ({
+              'magic': magic,
+              'universe': universe,
+            },
+            sections_iter()
+            )
+
+class AppinfoIndex(object):
+    """Index of the app sections of appinfo.vdf, mapping appids to their
+    (offset, size, change_number), to be kept next to it and saved as JSON.
+
+    It is valid as long as the size, mtime and header of the file did not
+    change. When they did, sections still found where they were are kept, and
+    the file is only walked from the first one that moved.
+
+    .. code:: python
+
+        >>> index = AppinfoIndex.load(index_path)
+        >>> with open(appinfo_path, 'rb') as fp:
+        ...     index.update(fp, os.fstat(fp.fileno()))
+        ...     header, apps = parse_appinfo(fp, appids=[440], offsets=index.offsets(fp, [440]))
+        >>> if index.changed:
+        ...     index.save(index_path)
+    """
+    VERSION = 1
+
+    def __init__(self):
+        self.stamp = None
+        self.apps = {}
+        self.changed = False
+
+    @classmethod
+    def load(cls, path):
+        """Load a saved index, or return an empty one if it can't be read"""
+        index = cls()
+        try:
+            with open(path) as fp:
+                data = json.load(fp)
+            if data['version'] == cls.VERSION:
+                index.stamp = data['stamp']
+                index.apps = {int(appid): tuple(entry) for appid, entry in data['apps'].items()}
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+        return index
+
+    def save(self, path):
+        data = {'version': self.VERSION, 'stamp': self.stamp, 'apps': self.apps}
+        with open(path, 'w') as fp:
+            json.dump(data, fp)
+        self.changed = False
+
+    def update(self, fp, st):
+        """Bring the index up to date with appinfo.vdf
+
+        :param fp: file-like object, or buffer (e.g. :class:`mmap.mmap`)
+        :param st: :func:`os.stat` result of the file
+        :raises: SyntaxError
+        :return: ``True`` if the index changed
+        :rtype: :class:`bool`
+        """
+        reader = _BufferReader(fp) if isinstance(fp, BUFFER_TYPES) else fp
+        position = reader.tell()
+        reader.seek(0)
+        header = reader.read(8)
+        if header[:1] >= b')':
+            header += reader.read(8)  # key table offset
+        header = header.hex()
+
+        stamp = [st.st_size, st.st_mtime_ns, header]
+        if stamp == self.stamp:
+            reader.seek(position)
+            return False
+
+        # The magic and universe must match for the old offsets to mean
+        # anything, the key table offset moves along with the sections
+        start = None
+        if self.stamp is not None and self.stamp[2][:16] == header[:16]:
+            start = self._unchanged(reader)
+
+        if start is None:
+            self.apps = {}
+        reader.seek(0)
+        _, sections = index_appinfo(reader, start)
+        for appid, offset, size, change_number in sections:
+            self.apps[appid] = (offset, size, change_number)
+
+        self.stamp = stamp
+        self.changed = True
+        reader.seek(position)
+        return True
+
+    def offsets(self, fp, appids):
+        """Offsets of the sections of appids, as expected by :func:`parse_appinfo`
+
+        The sections are checked to be where the index says, and the index is
+        rebuilt if any of them isn't.
+        """
+        reader = _BufferReader(fp) if isinstance(fp, BUFFER_TYPES) else fp
+        position = reader.tell()
+        found = {appid: self.apps[appid] for appid in appids if appid in self.apps}
+        if not all(self._in_place(reader, appid, entry) for appid, entry in found.items()):
+            reader.seek(0)
+            _, sections = index_appinfo(reader)
+            self.apps = {appid: (offset, size, change_number)
+                         for appid, offset, size, change_number in sections}
+            self.changed = True
+            found = {appid: self.apps[appid] for appid in appids if appid in self.apps}
+        reader.seek(position)
+        return {appid: entry[0] for appid, entry in found.items()}
+
+    def _in_place(self, reader, appid, entry):
+        offset, size, change_number = entry
+        reader.seek(offset)
+        data = reader.read(48)
+        if len(data) != 48:
+            return False
+        return (uint32.unpack_from(data, 0)[0] == appid and
+                uint32.unpack_from(data, 4)[0] == size and
+                uint32.unpack_from(data, 44)[0] == change_number)
+
+    def _unchanged(self, reader):
+        """Drop the sections that moved or changed, and return the offset
+        to walk the file from, or None if it has to be walked whole"""
+        entries = sorted(self.apps.items(), key=lambda item: item[1][0])
+
+        # Steam rewrites the file in the same order, so the sections before
+        # the first one that changed are still in place
+        lo, hi = 0, len(entries)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._in_place(reader, *entries[mid]):
+                lo = mid + 1
+            else:
+                hi = mid
+
+        if lo == 0:
+            return None
+
+        self.apps = dict(entries[:lo])
+        offset, size, _ = entries[lo - 1][1]
+        return offset + 8 + size
+
 def parse_packageinfo(fp, mapper=None):
     """Parse packageinfo.vdf from the Steam appcache folder
 
-    :param fp: file-like object
+    :param fp: file-like object, or buffer (e.g. :class:`bytes` or :class:`mmap.mmap`)
+               to parse in place, which is much faster
     :param mapper: Python object class to return
     :raises: SyntaxError
     :rtype: (:class:`Generator` returning :class:`dict` by default or mapper class if set)
@@ -167,6 +414,9 @@ def parse_packageinfo(fp, mapper=None):
 #   ---- end of section ---------
 #   uint32   - EOF: 0xFFFFFFFF
 
+    if isinstance(fp, BUFFER_TYPES):
+        fp = _BufferReader(fp)
+
     magic = fp.read(4)
     if magic not in (b"'UV\x06", b"(UV\x06"):
         raise SyntaxError("Invalid magic, got %s" % repr(magic))
@@ -189,7 +439,7 @@ def parse_packageinfo(fp, mapper=None):
             if magic == b"(UV\x06":
                 pkg['token'] = uint64.unpack(fp.read(8))[0]
 
-            pkg['data'] = binary_load(fp, mapper=mapper)
+            pkg['data'] = _load_vdf(fp, mapper=mapper)
 
             yield pkg
 
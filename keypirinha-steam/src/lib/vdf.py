@@ -4,6 +4,7 @@ Module for deserializing/serializing to and from VDF
 __version__ = "4.0"
 __author__ = "Rossen Georgiev / Solstice Game Studios"
 
+import mmap
 import re
 import struct
 import sys
@@ -281,10 +282,42 @@ BIN_END         = b'\x08'
 BIN_INT64       = b'\x0A'
 BIN_END_ALT     = b'\x0B'
 
-def binary_loads(b, mapper=dict, merge_duplicate_keys=True, alt_format=False, key_table=None, raise_on_remaining=True):
+BUFFER_TYPES = (bytes, bytearray, memoryview, mmap.mmap)
+
+def _compile_fields(fields):
     """
-    Deserialize ``b`` (``bytes`` containing a VDF in "binary form")
-    to a Python object.
+    Turns key paths (tuples of keys, or dotted strings) into a tree of
+    nested dicts, where ``None`` stands for a whole subtree.
+    """
+    if fields is None:
+        return None
+
+    tree = {}
+    for path in fields:
+        if isinstance(path, str):
+            path = path.split('.')
+        node = tree
+        for key in path[:-1]:
+            node = node.setdefault(key, {})
+            if node is None:
+                # a shorter path already selects the whole subtree
+                break
+        else:
+            node[path[-1]] = None
+    return tree
+
+class _Discard(dict):
+    """Mapping dropping everything set in it, for subtrees out of a projection"""
+    def __setitem__(self, key, value):
+        pass
+
+_DISCARD = _Discard()
+
+def binary_loads(b, mapper=dict, merge_duplicate_keys=True, alt_format=False, key_table=None, raise_on_remaining=True,
+                 fields=None):
+    """
+    Deserialize ``b`` (``bytes``, ``bytearray``, ``memoryview`` or ``mmap``
+    containing a VDF in "binary form") to a Python object.
 
     ``mapper`` specifies the Python object used after deserializetion. ``dict` is
     used by default. Alternatively, ``collections.OrderedDict`` can be used if you
@@ -298,14 +331,174 @@ def binary_loads(b, mapper=dict, merge_duplicate_keys=True, alt_format=False, ke
     which do not encode strings directly but instead store them in an out-of-band
     table. Newer `appinfo.vdf` format stores this table the end of the file,
     and it is needed to deserialize the binary VDF objects in that file.
+
+    ``fields`` restricts the result to some key paths, see :func:`binary_load`.
     """
     mapper = dict if mapper is None else mapper
-    if not isinstance(b, bytes):
+    if not isinstance(b, BUFFER_TYPES):
         raise TypeError("Expected s to be bytes, got %s" % type(b))
 
-    return binary_load(BytesIO(b), mapper, merge_duplicate_keys, alt_format, key_table, raise_on_remaining)
+    result, offset = binary_loads_from(b, 0, mapper, merge_duplicate_keys, alt_format, key_table, fields)
+
+    if raise_on_remaining and offset < len(b):
+        raise SyntaxError("Binary VDF ended at offset %d, but there is more data remaining" % offset)
 
-def binary_load(fp, mapper=dict, merge_duplicate_keys=True, alt_format=False, key_table=None, raise_on_remaining=False):
+    return result
+
+def binary_loads_from(buf, offset=0, mapper=dict, merge_duplicate_keys=True, alt_format=False, key_table=None,
+                      fields=None):
+    """
+    Deserialize the binary VDF starting at ``offset`` in ``buf`` (``bytes``,
+    ``bytearray``, ``memoryview`` or ``mmap``) to a Python object.
+
+    Unlike :func:`binary_load`, the buffer is parsed in place with an integer
+    cursor: strings are located with ``find()`` and numbers are read with
+    ``unpack_from()``, so there is no small read or copy per value. Memory
+    mapping a large file (e.g. ``appinfo.vdf``) avoids loading it at all.
+    A ``memoryview`` is copied once, as it has no ``find()``.
+
+    With ``fields``, the subtrees out of the projection are skipped by moving
+    the cursor only, without decoding anything.
+
+    See :func:`binary_load` for the other arguments.
+
+    :return: (object, offset right after the VDF)
+    """
+    mapper = dict if mapper is None else mapper
+    if not issubclass(mapper, Mapping):
+        raise TypeError("Expected mapper to be subclass of dict, got %s" % type(mapper))
+    if isinstance(buf, memoryview):
+        buf = buf.tobytes()
+
+    int32 = struct.Struct('<i')
+    uint64 = struct.Struct('<Q')
+    int64 = struct.Struct('<q')
+    float32 = struct.Struct('<f')
+
+    find = buf.find
+    size = len(buf)
+
+    def string_end(pos, wide=False):
+        end = find(b'\x00\x00' if wide else b'\x00', pos)
+
+        if end == -1:
+            raise SyntaxError("Unterminated cstring (offset: %d)" % pos)
+
+        if wide:
+            end += (end - pos) % 2
+
+        return end
+
+    def read_string(pos, wide=False):
+        end = string_end(pos, wide)
+
+        if wide:
+            return buf[pos:end].decode('utf-16'), end + 2
+
+        return buf[pos:end].decode('utf-8', 'replace'), end + 1
+
+    def skip_value(t, start, pos):
+        # move past the value of type t found at start, its key being read
+        depth = 0
+        while True:
+            if t == 0:
+                depth += 1
+            elif t == CURRENT_BIN_END:
+                depth -= 1
+            elif t == 1:
+                pos = string_end(pos) + 1
+            elif t == 5:
+                pos = string_end(pos, wide=True) + 2
+            elif t in (2, 3, 4, 6):
+                pos += 4
+            elif t in (7, 10):
+                pos += 8
+            else:
+                raise SyntaxError("Unknown data type at offset %d: %s" % (start, repr(bytes([t]))))
+
+            if depth == 0:
+                return pos
+            if pos >= size:
+                raise SyntaxError("Reached EOF, but Binary VDF is incomplete")
+
+            start = pos
+            t = buf[pos]
+            pos += 1
+            if t != CURRENT_BIN_END:
+                pos = pos + 4 if key_table else string_end(pos) + 1
+
+    stack = [mapper()]
+    nodes = [_compile_fields(fields)]
+    CURRENT_BIN_END = (BIN_END if not alt_format else BIN_END_ALT)[0]
+    pos = offset
+
+    while pos < size:
+        start = pos
+        t = buf[pos]
+        pos += 1
+
+        if t == CURRENT_BIN_END:
+            if len(stack) > 1:
+                stack.pop()
+                nodes.pop()
+                continue
+            break
+
+        if key_table:
+            key = key_table[int32.unpack_from(buf, pos)[0]]
+            pos += 4
+        else:
+            key, pos = read_string(pos)
+
+        node = nodes[-1]
+        if node is not None:
+            # only a path ending here selects a value that is not a mapping
+            if key not in node or (t != 0 and node[key] is not None):
+                pos = skip_value(t, start, pos)
+                continue
+            node = node[key]
+
+        if t == 0:  # BIN_NONE
+            if merge_duplicate_keys and key in stack[-1]:
+                _m = stack[-1][key]
+            else:
+                _m = mapper()
+                stack[-1][key] = _m
+            stack.append(_m)
+            nodes.append(node)
+        elif t == 1:  # BIN_STRING
+            stack[-1][key], pos = read_string(pos)
+        elif t == 5:  # BIN_WIDESTRING
+            stack[-1][key], pos = read_string(pos, wide=True)
+        elif t in (2, 4, 6):  # BIN_INT32, BIN_POINTER, BIN_COLOR
+            val = int32.unpack_from(buf, pos)[0]
+            pos += 4
+
+            if t == 4:
+                val = POINTER(val)
+            elif t == 6:
+                val = COLOR(val)
+
+            stack[-1][key] = val
+        elif t == 7:  # BIN_UINT64
+            stack[-1][key] = UINT_64(uint64.unpack_from(buf, pos)[0])
+            pos += 8
+        elif t == 10:  # BIN_INT64
+            stack[-1][key] = INT_64(int64.unpack_from(buf, pos)[0])
+            pos += 8
+        elif t == 3:  # BIN_FLOAT32
+            stack[-1][key] = float32.unpack_from(buf, pos)[0]
+            pos += 4
+        else:
+            raise SyntaxError("Unknown data type at offset %d: %s" % (start, repr(bytes([t]))))
+
+    if len(stack) != 1:
+        raise SyntaxError("Reached EOF, but Binary VDF is incomplete")
+
+    return stack.pop(), pos
+
+def binary_load(fp, mapper=dict, merge_duplicate_keys=True, alt_format=False, key_table=None, raise_on_remaining=False,
+                fields=None):
     """
     Deserialize ``fp`` (a ``.read()``-supporting file-like object containing
     binary VDF) to a Python object.
@@ -322,6 +515,10 @@ def binary_load(fp, mapper=dict, merge_duplicate_keys=True, alt_format=False, ke
     which do not encode strings directly but instead store them in an out-of-band
     table. Newer `appinfo.vdf` format stores this table the end of the file,
     and it is needed to deserialize the binary VDF objects in that file.
+
+    ``fields`` restricts the result to some key paths, given as tuples of keys
+    or dotted strings (e.g. ``{'appinfo.common.name', 'appinfo.common.type'}``).
+    A path selects the whole subtree under it, everything else is left out.
     """
     if not hasattr(fp, 'read') or not hasattr(fp, 'tell') or not hasattr(fp, 'seek'):
         raise TypeError("Expected fp to be a file-like object with tell()/seek() and read() returning bytes")
@@ -370,12 +567,14 @@ def binary_load(fp, mapper=dict, merge_duplicate_keys=True, alt_format=False, ke
         return result
 
     stack = [mapper()]
+    nodes = [_compile_fields(fields)]
     CURRENT_BIN_END = BIN_END if not alt_format else BIN_END_ALT
 
     for t in iter(lambda: fp.read(1), b''):
         if t == CURRENT_BIN_END:
             if len(stack) > 1:
                 stack.pop()
+                nodes.pop()
                 continue
             break
 
@@ -389,17 +588,30 @@ def binary_load(fp, mapper=dict, merge_duplicate_keys=True, alt_format=False, ke
         else:
             key = read_string(fp)
 
+        # values out of the projection still have to be read, but are
+        # dropped in _DISCARD (False marks their subtrees in nodes)
+        node = nodes[-1]
+        if node is not None and node is not False:
+            node = node.get(key, False)
+            # only a path ending here selects a value that is not a mapping
+            if node and t != BIN_NONE:
+                node = False
+        parent = stack[-1] if node is not False else _DISCARD
+
         if t == BIN_NONE:
-            if merge_duplicate_keys and key in stack[-1]:
-                _m = stack[-1][key]
+            if parent is _DISCARD:
+                _m = _DISCARD
+            elif merge_duplicate_keys and key in parent:
+                _m = parent[key]
             else:
                 _m = mapper()
-                stack[-1][key] = _m
+                parent[key] = _m
             stack.append(_m)
+            nodes.append(node)
         elif t == BIN_STRING:
-            stack[-1][key] = read_string(fp)
+            parent[key] = read_string(fp)
         elif t == BIN_WIDESTRING:
-            stack[-1][key] = read_string(fp, wide=True)
+            parent[key] = read_string(fp, wide=True)
         elif t in (BIN_INT32, BIN_POINTER, BIN_COLOR):
             val = int32.unpack(fp.read(int32.size))[0]
 
@@ -408,13 +620,13 @@ def binary_load(fp, mapper=dict, merge_duplicate_keys=True, alt_format=False, ke
             elif t == BIN_COLOR:
                 val = COLOR(val)
 
-            stack[-1][key] = val
+            parent[key] = val
         elif t == BIN_UINT64:
-            stack[-1][key] = UINT_64(uint64.unpack(fp.read(int64.size))[0])
+            parent[key] = UINT_64(uint64.unpack(fp.read(int64.size))[0])
         elif t == BIN_INT64:
-            stack[-1][key] = INT_64(int64.unpack(fp.read(int64.size))[0])
+            parent[key] = INT_64(int64.unpack(fp.read(int64.size))[0])
         elif t == BIN_FLOAT32:
-            stack[-1][key] = float32.unpack(fp.read(float32.size))[0]
+            parent[key] = float32.unpack(fp.read(float32.size))[0]
         else:
             raise SyntaxError("Unknown data type at offset %d: %s" % (fp.tell() - 1, repr(t)))
 
@@ -10,11 +10,14 @@ import keypirinha as kp
 import collections
 import time
 import json
+import mmap
 import os
 import re
 
 STEAM_ICON_CDN = "https://steamcdn-a.akamaihd.net/steamcommunity/public/images/apps/{0.id}/{0.icon}"
 App = collections.namedtuple('App', ['id', 'name', 'icon'])
+# The only parts of appinfo.vdf records used, the rest is skipped when parsing
+APPINFO_FIELDS = {'appinfo.common.name', 'appinfo.common.type', 'appinfo.common.clienticon'}
 
 
 class LowerKeyDict(dict):
@@ -138,12 +141,23 @@ class Steam(kp.Plugin):
             # We can return if all installed apps were in the cache
             return results
 
-        # Load appinfo.vdf to extract info about games
-        with open(appinfo_path, 'rb') as fp:
-            _, steamapps = appcache.parse_appinfo(fp, dict)
+        # Load appinfo.vdf to extract info about the games missing from the
+        # cache. The index kept in the package cache tells where their records
+        # are, so that the file doesn't have to be scanned
+        missing = [appid for appid in installed if appid not in self.appcache]
+        cache_path = self.get_package_cache_path(create=True)
+        index_path = os.path.join(cache_path, 'appinfo_index.json')
+        index = appcache.AppinfoIndex.load(index_path)
+        # The file is memory mapped so that records are parsed in place
+        with open(appinfo_path, 'rb') as fp, mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            index.update(buf, os.fstat(fp.fileno()))
+            offsets = index.offsets(buf, missing)
+            _, steamapps = appcache.parse_appinfo(buf, dict, appids=missing, fields=APPINFO_FIELDS, offsets=offsets)
             data = {app['appid']: app for app in steamapps}
+        if index.changed:
+            index.save(index_path)
 
-        for appid in installed:
+        for appid in missing:
             if self.should_terminate():
                 return results
 
@@ -166,7 +180,6 @@ class Steam(kp.Plugin):
         # Update and save the cache
         for app in results:
             self.appcache[app.id] = app
-        cache_path = self.get_package_cache_path(create=True)
         appcache_path = os.path.join(cache_path, 'appcache.json')
         with open(appcache_path, 'w') as fp:
             json.dump(list(self.appcache.values()), fp)